@@ -0,0 +1,160 @@
+import asyncio
+from aio_pika import ExchangeType, connect_robust, Message, DeliveryMode
+
+import grpc
+import proto.mafia_pb2_grpc as proto_grpc
+import proto.mafia_pb2 as proto
+
+CHANNELS = ['all', 'mafia']
+
+
+class BatchedChat:
+    def __init__(self):
+        self.pending = []
+        self.flushing = set()
+
+    def send(self, name, game_id, username, text):
+        if not self.pending:
+            asyncio.get_running_loop().call_soon(self.dispatch)
+        self.pending.append(((name, game_id, username), text))
+
+    def dispatch(self):
+        pending, self.pending = self.pending, []
+
+        task = asyncio.ensure_future(self.publish(pending))
+        self.flushing.add(task)
+        task.add_done_callback(self.flushing.discard)
+
+    async def flush(self):
+        await asyncio.sleep(0)
+
+        await asyncio.gather(*self.flushing)
+
+    async def forget(self, game_id, username):
+        for name in CHANNELS:
+            await self.leave(name, game_id, username)
+
+
+class Chat(BatchedChat):
+    def __init__(self, url):
+        super().__init__()
+
+        self.url = url
+
+        self.connection = None
+        self.channel = None
+        self.exchanges = dict()
+        self.queues = dict()
+        self.consumers = dict()
+
+    async def connect(self):
+        self.connection = await connect_robust(self.url)
+        self.channel = await self.connection.channel(publisher_confirms=False)
+
+        for name in CHANNELS:
+            self.exchanges[name] = await self.channel.declare_exchange(name, ExchangeType.DIRECT)
+
+    async def enter(self, name, game_id, username, on_message):
+        key = (name, game_id, username)
+
+        queue = self.queues.get(key)
+        if queue is None:
+            queue = await self.channel.declare_queue(exclusive=True)
+            await queue.bind(self.exchanges[name], routing_key=game_id)
+
+            self.queues[key] = queue
+
+        await queue.purge()
+
+        async def consume(message):
+            await on_message(message.body.decode())
+
+        self.consumers[key] = await queue.consume(consume, no_ack=True)
+
+    async def leave(self, name, game_id, username):
+        key = (name, game_id, username)
+
+        consumer_tag = self.consumers.pop(key, None)
+        if consumer_tag is not None:
+            await self.queues[key].cancel(consumer_tag)
+
+    async def forget(self, game_id, username):
+        await super().forget(game_id, username)
+
+        for name in CHANNELS:
+            queue = self.queues.pop((name, game_id, username), None)
+            if queue is not None:
+                await queue.delete(if_unused=False, if_empty=False)
+
+    async def publish(self, pending):
+        await asyncio.gather(*[
+            self.exchanges[name].publish(Message(f'{username}: {text}'.encode(), delivery_mode=DeliveryMode.NOT_PERSISTENT), routing_key=game_id)
+            for (name, game_id, username), text in pending
+        ])
+
+    async def close(self):
+        await self.flush()
+
+        if self.connection is not None:
+            await self.connection.close()
+
+
+class GrpcChat(BatchedChat):
+    def __init__(self, target):
+        super().__init__()
+
+        self.target = target
+
+        self.channel = None
+        self.stub = None
+        self.calls = dict()
+        self.readers = dict()
+        self.lock = asyncio.Lock()
+
+    async def connect(self):
+        self.channel = grpc.aio.insecure_channel(self.target)
+        self.stub = proto_grpc.MafiaStub(self.channel)
+
+    async def read(self, call, on_message):
+        async for message in call:
+            await on_message(f'{message.username}: {message.text}')
+
+    async def enter(self, name, game_id, username, on_message):
+        key = (name, game_id, username)
+
+        call = self.stub.Chat()
+        await call.write(proto.ChatAction(join=proto.ChatJoin(info=proto.PlayerInfo(game_id=game_id, username=proto.Username(name=username)), channel=name)))
+
+        self.calls[key] = call
+        self.readers[key] = asyncio.create_task(self.read(call, on_message))
+
+    async def leave(self, name, game_id, username):
+        key = (name, game_id, username)
+
+        call = self.calls.pop(key, None)
+        if call is None:
+            return
+
+        async with self.lock:
+            await call.done_writing()
+
+        try:
+            await self.readers.pop(key)
+        except grpc.aio.AioRpcError:
+            pass
+
+    async def publish(self, pending):
+        async with self.lock:
+            for key, text in pending:
+                call = self.calls.get(key)
+                if call is not None:
+                    await call.write(proto.ChatAction(text=text))
+
+    async def close(self):
+        await self.flush()
+
+        for name, game_id, username in list(self.calls):
+            await self.leave(name, game_id, username)
+
+        if self.channel is not None:
+            await self.channel.close()
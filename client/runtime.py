@@ -0,0 +1,68 @@
+import asyncio
+import sys
+import threading
+
+import grpc
+import httpx
+import proto.mafia_pb2_grpc as proto_grpc
+
+
+class StdinReader:
+    def __init__(self, loop):
+        self.loop = loop
+        self.lines = asyncio.Queue()
+
+        threading.Thread(target=self.run, name='StdinReader', daemon=True).start()
+
+    def run(self):
+        for line in sys.stdin:
+            self.loop.call_soon_threadsafe(self.lines.put_nowait, line.rstrip('\n'))
+
+        self.loop.call_soon_threadsafe(self.lines.put_nowait, None)
+
+    async def read_line(self):
+        line = await self.lines.get()
+        if line is None:
+            raise EOFError
+
+        return line
+
+
+class Runtime:
+    def __init__(self, grpc_target, rest_url, graphql_url, chat):
+        self.grpc_target = grpc_target
+        self.rest_url = rest_url
+        self.graphql_url = graphql_url
+        self.chat = chat
+
+        self.http = None
+        self.channel = None
+        self.stub = None
+        self.stdin = None
+
+    async def __aenter__(self):
+        self.http = httpx.AsyncClient(limits=httpx.Limits(max_keepalive_connections=20), timeout=30)
+
+        self.channel = grpc.aio.insecure_channel(self.grpc_target)
+        self.stub = proto_grpc.MafiaStub(self.channel)
+
+        await self.chat.connect()
+
+        self.stdin = StdinReader(asyncio.get_running_loop())
+
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.chat.close()
+        await self.channel.close()
+        await self.http.aclose()
+
+    async def input(self, prompt=''):
+        print(prompt, end='', flush=True)
+
+        return await self.stdin.read_line()
+
+    async def graphql(self, operation, variables):
+        response = await self.http.post(self.graphql_url, json={'id': operation, 'variables': variables})
+
+        return response.json()['data']
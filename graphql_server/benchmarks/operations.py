@@ -0,0 +1,71 @@
+import asyncio
+import time
+from argparse import ArgumentParser
+from uuid import uuid4
+
+from ariadne import graphql_sync
+
+from main import documents, game_ids, games, player_game_ids, schema
+
+
+ADD_GAME = """
+query AddGame($id: String!, $players: [String]!, $scores: [Int]!) {
+    addGame(id: $id, players: $players, scores: $scores)
+}
+"""
+
+
+def variables(i):
+    return {'id': str(uuid4()), 'players': [f'a{i}', f'b{i}', f'c{i}', f'd{i}'], 'scores': [1, 0, 0, 0]}
+
+
+def f_string(i):
+    game = variables(i)
+    players = ', '.join(f'"{player}"' for player in game['players'])
+
+    return {'query': f'{{ addGame(id: "{game["id"]}", players: [{players}], scores: {game["scores"]}) }}'}
+
+
+def query_with_variables(i):
+    return {'query': ADD_GAME, 'variables': variables(i)}
+
+
+def persisted(i):
+    return {'id': 'AddGame', 'variables': variables(i)}
+
+
+async def measure(execute, make_body, requests):
+    bodies = [make_body(i) for i in range(requests)]
+
+    start = time.perf_counter()
+
+    for body in bodies:
+        result = execute(body)
+        if asyncio.iscoroutine(result):
+            await result
+
+    return requests / (time.perf_counter() - start)
+
+
+def main():
+    parser = ArgumentParser(description='addGame requests per second handled by the graphql endpoint')
+    parser.add_argument('--requests', type=int, default=5000)
+    args = parser.parse_args()
+
+    runs = [
+        ('before: graphql_sync, f-string query', lambda body: graphql_sync(schema, body), f_string),
+        ('after: f-string query', documents.execute, f_string),
+        ('after: cached query with variables', documents.execute, query_with_variables),
+        ('after: persisted operation', documents.execute, persisted),
+    ]
+
+    for name, execute, make_body in runs:
+        games.clear()
+        game_ids.clear()
+        player_game_ids.clear()
+        rate = asyncio.run(measure(execute, make_body, args.requests))
+        print(f'{name:>40}: {rate:.0f} requests/sec')
+
+
+if __name__ == '__main__':
+    main()
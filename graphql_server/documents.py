@@ -0,0 +1,76 @@
+from functools import lru_cache
+from hashlib import sha256
+from inspect import isawaitable
+
+from graphql import DocumentNode, GraphQLError, execute, parse, validate
+
+
+class Documents:
+    def __init__(self, schema, operations_path, cache_size=1024):
+        self.schema = schema
+
+        self.by_id = dict()
+        self.by_hash = dict()
+
+        with open(operations_path) as operations_file:
+            source = operations_file.read()
+
+        operations = parse(source)
+
+        for definition in operations.definitions:
+            document = DocumentNode(definitions=[definition])
+
+            errors = validate(schema, document)
+            if errors:
+                raise errors[0]
+
+            self.by_id[definition.name.value] = document
+            text = source[definition.loc.start:definition.loc.end]
+            self.by_hash[sha256(text.encode()).hexdigest()] = document
+
+        self.parse_and_validate = lru_cache(maxsize=cache_size)(self.parse_and_validate)
+
+    def parse_and_validate(self, query):
+        try:
+            document = parse(query)
+        except GraphQLError as error:
+            return None, [error]
+
+        return document, validate(self.schema, document)
+
+    def get(self, data):
+        if 'id' in data:
+            if data['id'] not in self.by_id:
+                return None, [GraphQLError(f'Unknown persisted operation: {data["id"]}')]
+            return self.by_id[data['id']], []
+
+        persisted_query = data.get('extensions', {}).get('persistedQuery')
+        if persisted_query and persisted_query.get('sha256Hash') in self.by_hash:
+            return self.by_hash[persisted_query['sha256Hash']], []
+        if persisted_query and 'query' not in data:
+            return None, [GraphQLError('PersistedQueryNotFound')]
+
+        if not isinstance(data.get('query'), str):
+            return None, [GraphQLError('The query must be a string')]
+
+        return self.parse_and_validate(data['query'])
+
+    async def execute(self, data, context_value=None):
+        if not isinstance(data, dict):
+            return False, {'errors': [GraphQLError('Operation data should be a JSON object').formatted]}
+
+        document, errors = self.get(data)
+        if errors:
+            return False, {'errors': [error.formatted for error in errors]}
+
+        result = execute(
+            self.schema,
+            document,
+            context_value=context_value,
+            variable_values=data.get('variables'),
+            operation_name=data.get('operationName'),
+        )
+        if isawaitable(result):
+            result = await result
+
+        return True, result.formatted
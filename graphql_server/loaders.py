@@ -0,0 +1,37 @@
+import asyncio
+
+
+class DataLoader:
+    def __init__(self, batch_load):
+        self.batch_load = batch_load
+
+        self.cache = dict()
+        self.pending = []
+
+    def load(self, key):
+        if key in self.cache:
+            return self.cache[key]
+
+        loop = asyncio.get_running_loop()
+
+        future = loop.create_future()
+        self.cache[key] = future
+
+        if not self.pending:
+            loop.call_soon(self.dispatch)
+        self.pending.append((key, future))
+
+        return future
+
+    def dispatch(self):
+        pending, self.pending = self.pending, []
+
+        try:
+            values = self.batch_load([key for key, _ in pending])
+        except Exception as exception:
+            for _, future in pending:
+                future.set_exception(exception)
+            return
+
+        for (_, future), value in zip(pending, values):
+            future.set_result(value)
@@ -1,7 +1,14 @@
-from ariadne import load_schema_from_path, make_executable_schema, ObjectType, graphql_sync
-from flask import Flask, request, jsonify
-from flask_cors import CORS
+import asyncio
+import uvicorn
+from ariadne import load_schema_from_path, make_executable_schema, ObjectType
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse
+from starlette.routing import Route
 from dataclasses import dataclass, asdict, field
+from documents import Documents
+from loaders import DataLoader
 
 @dataclass
 class PlayerScore:
@@ -15,26 +22,60 @@ class GameInfo:
     players: list[str]
     comments: list[str] = field(default_factory=list) 
 
-app = Flask(__name__)
-CORS(app)
-
 games: dict[str, GameInfo] = dict()
+game_ids: list[str] = list()
+player_game_ids: dict[str, list[str]] = dict()
+
+PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+def load_games(ids):
+    return [games.get(id) for id in ids]
+
 
+def make_context(request):
+    return {'request': request, 'games': DataLoader(load_games)}
 
-@app.route("/graphql", methods=["POST"])
-def graphql_server():
-    data = request.get_json()
-    success, result = graphql_sync(schema, data, context_value=request, debug=app.debug)
+
+async def graphql_server(request):
+    try:
+        data = await request.json()
+    except ValueError:
+        return JSONResponse({'errors': [{'message': 'Request body is not valid JSON'}]}, 400)
+
+    context = make_context(request)
+
+    if isinstance(data, list):
+        results = await asyncio.gather(*[documents.execute(operation, context_value=context) for operation in data])
+        return JSONResponse([result for _, result in results])
+
+    success, result = await documents.execute(data, context_value=context)
     status_code = 200 if success else 400
-    return jsonify(result), status_code
+    return JSONResponse(result, status_code)
 
 
 query = ObjectType("Query")
+game_info = ObjectType("GameInfo")
 
 
 @query.field('getGames')
-def resolve_getGames(obj, info):
-    return [asdict(game_info) for game_info in games.values()]
+def resolve_getGames(obj, info, first=PAGE_SIZE, after=None, player=None):
+    ids = game_ids if player is None else player_game_ids.get(player, [])
+
+    if after is None:
+        start = 0
+    elif after.isdigit():
+        start = int(after)
+    else:
+        raise ValueError('Invalid cursor')
+
+    end = start + max(0, min(first, MAX_PAGE_SIZE))
+
+    return {
+        'games': ids[start:end],
+        'cursor': str(end) if end < len(ids) else None,
+    }
 
 
 @query.field('addGame')
@@ -44,6 +85,10 @@ def resolve_addGame(obj, info, id, players, scores):
     scoreboard = [PlayerScore(player, score) for player, score in zip(players, scores)]
     games[id] = GameInfo(id, scoreboard, players)
 
+    game_ids.append(id)
+    for player in players:
+        player_game_ids.setdefault(player, []).append(id)
+
 
 @query.field('getScoreboard')
 def resolve_getScoreboard(obj, info, id):
@@ -61,7 +106,26 @@ def resolve_addComment(obj, info, id, comment):
         games[id].comments.append(comment)
 
 
-schema = make_executable_schema(load_schema_from_path("mafia.graphql"), query)
+def resolve_game_info_field(name):
+    async def resolve(obj, info):
+        loaded = await info.context['games'].load(obj)
+        return getattr(loaded, name)
+
+    return resolve
+
+
+game_info.set_field('id', lambda obj, info: obj)
+for name in ['scoreboard', 'players', 'comments']:
+    game_info.set_field(name, resolve_game_info_field(name))
+
+
+schema = make_executable_schema(load_schema_from_path("mafia.graphql"), query, game_info)
+documents = Documents(schema, "operations.graphql")
+
+app = Starlette(
+    routes=[Route('/graphql', graphql_server, methods=['POST'])],
+    middleware=[Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*'])],
+)
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=13371)
+    uvicorn.run(app, host='0.0.0.0', port=13371)
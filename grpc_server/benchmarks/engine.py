@@ -0,0 +1,322 @@
+import asyncio
+import gc
+import json
+import time
+import tracemalloc
+from argparse import ArgumentParser
+from random import Random
+
+import proto.mafia_pb2 as proto
+
+from lib.mafia_game import MafiaGame, MAFIA, COMMISSAR
+from main import Mafia
+
+PLAYERS = [f'user{i}' for i in range(len(Mafia.ROLES))]
+
+
+class DummyOutbox:
+    def __init__(self):
+        self.results = 0
+
+    def Put(self, game_id, results, scores):
+        self.results += 1
+
+
+class Context:
+    async def abort(self, code, details):
+        raise RuntimeError(f'{code}: {details}')
+
+
+class CountingLoop(asyncio.SelectorEventLoop):
+    def __init__(self):
+        super().__init__()
+
+        self.iterations = 0
+        self.wakeups = 0
+
+    def _run_once(self):
+        self.iterations += 1
+
+        super()._run_once()
+
+    def call_soon(self, *args, **kwargs):
+        self.wakeups += 1
+
+        return super().call_soon(*args, **kwargs)
+
+
+CONTEXT = Context()
+
+
+def make_roles(rng):
+    return dict(zip(PLAYERS, rng.sample(Mafia.ROLES, k=len(PLAYERS))))
+
+
+def others(players_alive, username):
+    return [player for player in players_alive if player != username]
+
+
+async def engine_player(game, username, rng):
+    role = await game.GetPlayerRole(username)
+
+    while True:
+        players_alive = list(await game.GetPlayersAlive())
+
+        if username in players_alive and role == COMMISSAR:
+            checked = rng.choice(others(players_alive, username))
+            if await game.CheckMafia(username, checked) and rng.random() < 0.5:
+                await game.PublishMafia(checked)
+        elif username in players_alive and role == MAFIA:
+            await game.SetKilled(rng.choice(others(players_alive, username)), username)
+
+        await game.WaitNight()
+
+        if game.CheckWinner():
+            return
+
+        players_alive = list(await game.GetPlayersAlive())
+        await game.VoteExecute(rng.choice(others(players_alive, username) + ['']) if username in players_alive else '')
+
+        if game.CheckWinner():
+            return
+
+
+async def servicer_player(servicer, game_id, username, rng):
+    info = proto.PlayerInfo(game_id=game_id, username=proto.Username(name=username))
+
+    role = servicer.games[game_id].player_roles[username]
+
+    def request(player):
+        return proto.PlayerRequest(info=info, player=proto.Username(name=player))
+
+    while True:
+        do_action = (await servicer.EndDay(info, CONTEXT)).do_action
+
+        users = await servicer.GetPlayersAlive(info, CONTEXT)
+        players_alive = [user.name for user in users.username]
+
+        if do_action and role == COMMISSAR:
+            response = await servicer.CheckMafia(request(rng.choice(others(players_alive, username))), CONTEXT)
+            if response.is_mafia and rng.random() < 0.5:
+                await servicer.PublishMafia(info, CONTEXT)
+        elif do_action and role == MAFIA:
+            await servicer.Kill(request(rng.choice(others(players_alive, username))), CONTEXT)
+
+        await servicer.EndNight(info, CONTEXT)
+
+        if (await servicer.CheckWinner(info, CONTEXT)).winner:
+            break
+
+        users = await servicer.GetPlayersAlive(info, CONTEXT)
+        players_alive = [user.name for user in users.username]
+
+        vote = rng.choice(others(players_alive, username) + ['']) if username in players_alive else ''
+        await servicer.Execute(request(vote), CONTEXT)
+
+        if (await servicer.CheckWinner(info, CONTEXT)).winner:
+            break
+
+    await servicer.GetRoles(info, CONTEXT)
+
+
+async def actions(queue):
+    while True:
+        action = await queue.get()
+        if action is None:
+            return
+
+        yield action
+
+
+async def session_player(servicer, game_id, username, rng):
+    role = servicer.games[game_id].player_roles[username]
+
+    queue = asyncio.Queue()
+    queue.put_nowait(proto.SessionAction(join=proto.PlayerInfo(game_id=game_id, username=proto.Username(name=username))))
+
+    alive = True
+
+    async for event in servicer.GameSession(actions(queue), CONTEXT):
+        match event.WhichOneof('event'):
+            case 'phase':
+                players_alive = [user.name for user in event.phase.alive.username]
+
+                if event.phase.phase == proto.NIGHT:
+                    if alive and role == COMMISSAR:
+                        queue.put_nowait(proto.SessionAction(check=proto.Username(name=rng.choice(others(players_alive, username)))))
+                    elif alive and role == MAFIA:
+                        queue.put_nowait(proto.SessionAction(kill=proto.Username(name=rng.choice(others(players_alive, username)))))
+                elif event.phase.phase == proto.VOTE:
+                    vote = rng.choice(others(players_alive, username) + ['']) if alive else ''
+                    queue.put_nowait(proto.SessionAction(vote=proto.Username(name=vote)))
+            case 'check':
+                if event.check.is_mafia:
+                    queue.put_nowait(proto.SessionAction(publish=rng.random() < 0.5))
+            case 'night':
+                alive = alive and event.night.killed.name != username
+            case 'executed':
+                alive = alive and event.executed.name != username
+
+    queue.put_nowait(None)
+
+
+async def bench_create(n):
+    servicer = Mafia(DummyOutbox())
+    rng = Random(0)
+
+    roles = [make_roles(rng) for _ in range(n)]
+
+    for i in range(n):
+        servicer.AddGame(str(i), roles[i])
+
+    return n
+
+
+async def bench_check_winner(n):
+    game = MafiaGame(make_roles(Random(0)))
+
+    for _ in range(n):
+        game.CheckWinner()
+
+    return n
+
+
+async def bench_roles(n):
+    servicer = Mafia(DummyOutbox())
+    rng = Random(0)
+
+    for i in range(n):
+        game_id = str(i)
+        servicer.AddGame(game_id, make_roles(rng))
+
+        for username in PLAYERS:
+            await servicer.GetRoles(proto.PlayerInfo(game_id=game_id, username=proto.Username(name=username)), CONTEXT)
+
+    return n
+
+
+async def play_games(n, concurrency, play):
+    rng = Random(0)
+
+    async def worker(start):
+        for i in range(start, n, concurrency):
+            await play(str(i), rng)
+
+    await asyncio.gather(*[worker(start) for start in range(concurrency)])
+
+    return n
+
+
+async def bench_engine_games(n, concurrency):
+    async def play(game_id, rng):
+        game = MafiaGame(make_roles(rng))
+        await asyncio.gather(*[engine_player(game, username, rng) for username in PLAYERS])
+
+    return await play_games(n, concurrency, play)
+
+
+async def bench_servicer_games(n, concurrency):
+    servicer = Mafia(DummyOutbox())
+
+    async def play(game_id, rng):
+        servicer.AddGame(game_id, make_roles(rng))
+        await asyncio.gather(*[servicer_player(servicer, game_id, username, rng) for username in PLAYERS])
+
+    return await play_games(n, concurrency, play)
+
+
+async def bench_session_games(n, concurrency):
+    servicer = Mafia(DummyOutbox())
+
+    async def play(game_id, rng):
+        servicer.AddGame(game_id, make_roles(rng))
+        await asyncio.gather(*[session_player(servicer, game_id, username, rng) for username in PLAYERS])
+
+    return await play_games(n, concurrency, play)
+
+
+def run(benchmark):
+    loop = CountingLoop()
+    try:
+        return loop.run_until_complete(benchmark()), loop.iterations, loop.wakeups
+    finally:
+        loop.close()
+
+
+def measure(benchmark):
+    gc.collect()
+
+    start = time.perf_counter()
+    ops, iterations, wakeups = run(benchmark)
+    seconds = time.perf_counter() - start
+
+    gc.collect()
+
+    tracemalloc.start()
+    run(benchmark)
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'ops': ops,
+        'seconds': seconds,
+        'ops_per_sec': ops / seconds,
+        'loop_iterations_per_op': iterations / ops,
+        'wakeups_per_op': wakeups / ops,
+        'peak_bytes_per_op': peak / ops,
+        'retained_bytes_per_op': retained / ops,
+    }
+
+
+def compare(results, baseline):
+    for name, metrics in results.items():
+        print(name)
+
+        for metric, value in metrics.items():
+            if metric in ['ops', 'seconds']:
+                continue
+
+            old = baseline.get(name, {}).get(metric)
+            if not old:
+                print(f'  {metric:>22}: {value:14.2f}')
+            else:
+                print(f'  {metric:>22}: {old:14.2f} -> {value:14.2f} ({(value - old) / old * 100:+.1f}%)')
+
+
+def main():
+    parser = ArgumentParser(description='In-process benchmarks of the mafia game engine and servicer')
+    parser.add_argument('--games', type=int, default=2000)
+    parser.add_argument('--calls', type=int, default=200000)
+    parser.add_argument('--concurrency', type=int, default=100)
+    parser.add_argument('--only', nargs='*')
+    parser.add_argument('--output', default='engine.json')
+    parser.add_argument('--compare')
+    args = parser.parse_args()
+
+    benchmarks = {
+        'create': lambda: bench_create(args.games),
+        'check_winner': lambda: bench_check_winner(args.calls),
+        'roles': lambda: bench_roles(args.games),
+        'engine_games': lambda: bench_engine_games(args.games, args.concurrency),
+        'servicer_games': lambda: bench_servicer_games(args.games, args.concurrency),
+        'session_games': lambda: bench_session_games(args.games, args.concurrency),
+    }
+
+    results = dict()
+    for name, benchmark in benchmarks.items():
+        if args.only and name not in args.only:
+            continue
+
+        results[name] = measure(benchmark)
+        print(f'{name:>16}: {results[name]["ops_per_sec"]:12.1f} ops/s')
+
+    with open(args.output, 'w') as file:
+        json.dump(results, file, indent=2)
+
+    if args.compare:
+        with open(args.compare) as file:
+            compare(results, json.load(file))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+import asyncio
+import time
+from argparse import ArgumentParser
+from copy import copy
+
+from lib.lobby import Lobbies
+
+
+async def polling_client(users, username, stop):
+    seen = set()
+
+    users.add(username)
+
+    while not stop.is_set():
+        if seen != users:
+            seen = copy(users)
+
+        await asyncio.sleep(0.001)
+
+
+async def event_client(lobbies, username):
+    lobby = lobbies.Join(username)
+
+    async for _ in lobby.Watch(username):
+        pass
+
+
+async def measure(mode, clients, seconds, lobby_count):
+    stop = asyncio.Event()
+
+    if mode == 'polling':
+        users = set()
+        tasks = [asyncio.create_task(polling_client(users, f'user{i}', stop)) for i in range(clients)]
+    else:
+        lobbies = Lobbies(clients + 1, lambda lobby: None, lobby_count)
+        tasks = [asyncio.create_task(event_client(lobbies, f'user{i}')) for i in range(clients)]
+
+    await asyncio.sleep(0.1)
+
+    start = time.process_time()
+    await asyncio.sleep(seconds)
+    cpu = time.process_time() - start
+
+    stop.set()
+    if mode == 'event':
+        for i in range(clients):
+            lobbies.Leave(f'user{i}')
+    await asyncio.gather(*tasks)
+
+    return cpu
+
+
+def main():
+    parser = ArgumentParser(description='CPU spent by clients waiting in the lobby')
+    parser.add_argument('--clients', type=int, default=300)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--lobbies', type=int, default=1)
+    args = parser.parse_args()
+
+    for mode in ['polling', 'event']:
+        cpu = asyncio.run(measure(mode, args.clients, args.seconds, args.lobbies))
+        per_client = cpu / args.seconds / args.clients * 1000
+        print(f'{mode:>8}: {cpu:.3f}s CPU in {args.seconds}s, {per_client:.4f} ms CPU/s per waiting client')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,38 @@
+import asyncio
+
+
+class PhaseBarrier:
+    def __init__(self, count, callback=None):
+        self.cur = 0
+        self.count = count
+        self.callback = callback
+        self.phase = None
+
+    async def Wait(self, *args):
+        if self.phase is None:
+            self.phase = asyncio.get_running_loop().create_future()
+
+        phase = self.phase
+
+        self.cur += 1
+        if self.cur == self.count:
+            self.cur = 0
+            self.phase = None
+
+            try:
+                result = self.callback(*args) if self.callback else None
+            except Exception as exception:
+                phase.set_exception(exception)
+            else:
+                phase.set_result(result)
+
+        return await asyncio.shield(phase)
+
+    def Fail(self, exception):
+        phase = self.phase
+
+        self.cur = 0
+        self.phase = None
+
+        if phase is not None:
+            phase.set_exception(exception)
@@ -0,0 +1,61 @@
+import asyncio
+from collections import deque
+
+CHANNELS = ['all', 'mafia']
+
+
+class ChatRoom:
+    def __init__(self, history):
+        self.subscribers = set()
+        self.history = deque(maxlen=history)
+
+
+class ChatHub:
+    def __init__(self, history=50, buffer=256):
+        self.history = min(history, buffer)
+        self.buffer = buffer
+
+        self.rooms = dict()
+
+    def Subscribe(self, game_id, channel):
+        room = self.rooms.get((game_id, channel))
+        if room is None:
+            room = self.rooms[(game_id, channel)] = ChatRoom(self.history)
+
+        queue = asyncio.Queue(self.buffer)
+        for message in room.history:
+            queue.put_nowait(message)
+
+        room.subscribers.add(queue)
+
+        return queue
+
+    def Unsubscribe(self, game_id, channel, queue):
+        room = self.rooms.get((game_id, channel))
+        if room is not None:
+            room.subscribers.discard(queue)
+
+    def Publish(self, game_id, channel, message):
+        room = self.rooms.get((game_id, channel))
+        if room is None:
+            return
+
+        room.history.append(message)
+
+        for queue in room.subscribers:
+            self.Push(queue, message)
+
+    def Push(self, queue, message):
+        if queue.full():
+            queue.get_nowait()
+
+        queue.put_nowait(message)
+
+    def Close(self, game_id, channels):
+        for channel in channels:
+            room = self.rooms.pop((game_id, channel), None)
+            if room is None:
+                continue
+
+            for queue in room.subscribers:
+                self.Push(queue, None)
@@ -0,0 +1,104 @@
+import asyncio
+import time
+from uuid import uuid4
+
+
+class Lobby:
+    def __init__(self, capacity):
+        self.id = str(uuid4())
+        self.capacity = capacity
+        self.users = dict()
+
+        self.changed = asyncio.Event()
+
+        self.game_id = None
+        self.roles = None
+        self.assigned = asyncio.Event()
+        self.error = None
+        self.opened = None
+        self.filled = None
+
+    def Notify(self):
+        changed = self.changed
+        self.changed = asyncio.Event()
+        changed.set()
+
+    def IsFull(self):
+        return len(self.users) == self.capacity
+
+    def Add(self, username):
+        if not self.users:
+            self.opened = time.monotonic()
+
+        self.users[username] = None
+        self.Notify()
+
+    def Remove(self, username):
+        self.users.pop(username, None)
+        self.Notify()
+
+    def Assign(self, game_id, roles):
+        self.game_id = game_id
+        self.roles = roles
+        self.assigned.set()
+
+    def Fail(self, error):
+        self.error = error
+        self.assigned.set()
+
+    async def GetGameId(self):
+        await self.assigned.wait()
+
+        if self.error is not None:
+            raise self.error
+
+        return self.game_id
+
+    async def Watch(self, username):
+        while username in self.users:
+            changed = self.changed
+
+            yield list(self.users)
+
+            if self.IsFull():
+                return
+
+            await changed.wait()
+
+
+class Lobbies:
+    def __init__(self, capacity, on_full, count=1):
+        self.capacity = capacity
+        self.on_full = on_full
+
+        self.open = [Lobby(capacity) for _ in range(count)]
+        self.user_lobby = dict()
+
+    def Join(self, username):
+        if username in self.user_lobby:
+            return self.user_lobby[username]
+
+        index = max(range(len(self.open)), key=lambda i: len(self.open[i].users))
+
+        lobby = self.open[index]
+        lobby.Add(username)
+        self.user_lobby[username] = lobby
+
+        if lobby.IsFull():
+            lobby.filled = time.monotonic()
+            self.open[index] = Lobby(self.capacity)
+
+            for user in lobby.users:
+                del self.user_lobby[user]
+
+            self.on_full(lobby)
+
+        return lobby
+
+    def Leave(self, username):
+        lobby = self.user_lobby.pop(username, None)
+        if lobby is not None:
+            lobby.Remove(username)
+
+    def Size(self):
+        return len(self.user_lobby)
@@ -1,45 +1,117 @@
-import asyncio
+import time
 from datetime import datetime
 
-from lib.latch import Latch
+from lib.barrier import PhaseBarrier
+
+MAFIA = 'Мафия'
+COMMISSAR = 'Комиссар'
+CIVILIAN = 'Мирный'
+
+MAFIA_WON = 'Мафия'
+CIVILIANS_WON = 'Мирные'
+
+
+def MakeRoles(room_size, mafia_count, commissar_count):
+    if room_size < 2 * mafia_count + 1 or mafia_count < 1:
+        raise ValueError('Mafia has to be a minority of the room')
+    if commissar_count < 0 or mafia_count + commissar_count > room_size:
+        raise ValueError('Mafia and commissars do not fit into the room')
+
+    return [MAFIA] * mafia_count + [COMMISSAR] * commissar_count + [CIVILIAN] * (room_size - mafia_count - commissar_count)
+
 
 class MafiaGame:
-    def __init__(self, player_roles):
+    def __init__(self, player_roles, on_phase=None, trace=None):
         self.player_roles = player_roles
-        self.players_alive = [username for username in player_roles]
+        self.players_alive = dict.fromkeys(player_roles)
 
-        self.ready_to_wake = False
-        self.waiting = Latch(4, self.WakeEveryone)
-        self.not_waiting = Latch(4, self.SleepEveryone)
-        
-        self.execute_votes = {username: 0 for username in player_roles}
-        self.end_voting = False
-        self.voted = Latch(4, self.EndVoting)
-        self.know_executed = Latch(4, self.StartVoting)
+        self.mafia_players = [player for player, role in player_roles.items() if role == MAFIA]
+        self.mafia_left = len(self.mafia_players)
+        self.civilians_left = len(player_roles) - self.mafia_left
 
+        self.killed = ''
         self.mafia = ''
-        self.know_mafia = Latch(4, self.ResetMafia)
+        self.checked = dict()
+        self.night = PhaseBarrier(len(player_roles), self.EndNight)
+
+        self.execute_votes = dict()
+        self.leader = ''
+        self.leader_votes = 0
+        self.tied = False
+        self.voting = PhaseBarrier(len(player_roles), self.EndVoting)
 
         self.start = datetime.now()
+        self.last_active = time.monotonic()
 
-    def WakeEveryone(self):
-        self.ready_to_wake = True
+        self.on_phase = on_phase
+        self.phase_start = self.last_active
 
-    def SleepEveryone(self):
-        self.ready_to_wake = False
+        self.trace = trace
+        self.round = 1
+        self.arrivals = dict()
 
-    def EndVoting(self):
-        self.end_voting = True
+    def Touch(self):
+        self.last_active = time.monotonic()
+
+    def Close(self, exception):
+        self.night.Fail(exception)
+        self.voting.Fail(exception)
+
+    def Arrive(self, phase, username):
+        if not self.trace:
+            return
+
+        self.arrivals[username] = round((time.monotonic() - self.phase_start) * 1000, 3)
+        self.trace.Instant(f'{phase} arrival', {'round': self.round, 'player': username})
+
+    def EndPhase(self, phase, result):
+        now = time.monotonic()
+
+        if self.on_phase:
+            self.on_phase(phase, now - self.phase_start)
+
+        if self.trace:
+            self.trace.Span(phase, self.phase_start, now, {'round': self.round, 'arrivals_ms': self.arrivals, **result})
+            self.arrivals = dict()
+
+        self.phase_start = now
+
+    def Kill(self, username):
+        if username not in self.players_alive:
+            return
+
+        del self.players_alive[username]
 
-    def StartVoting(self, player_executed):
-        self.end_voting = False
+        if self.player_roles[username] == MAFIA:
+            self.mafia_left -= 1
+        else:
+            self.civilians_left -= 1
+
+    def EndNight(self):
+        killed, mafia = self.killed, self.mafia
 
-        if player_executed:
-            self.players_alive.remove(player_executed)
+        self.Kill(killed)
+        self.EndPhase('night', {'killed': killed})
 
-    def ResetMafia(self):
+        self.killed = ''
         self.mafia = ''
 
+        return killed, mafia
+
+    def EndVoting(self):
+        player_executed = '' if self.tied else self.leader
+
+        self.execute_votes = dict()
+        self.leader = ''
+        self.leader_votes = 0
+        self.tied = False
+
+        self.Kill(player_executed)
+        self.EndPhase('vote', {'executed': player_executed})
+        self.round += 1
+
+        return player_executed
+
     async def GetPlayerRole(self, username):
         return self.player_roles[username]
 
@@ -47,73 +119,56 @@ class MafiaGame:
         return self.player_roles
 
     async def GetPlayersAlive(self):
-        return self.players_alive
+        return self.players_alive.keys()
 
-    async def SetKilled(self, username):
-        self.killed = username
-
-    def GetKilled(self):
-        if self.killed in self.players_alive:
-            self.players_alive.remove(self.killed)
+    async def SetKilled(self, username, killer):
+        if self.killed or killer not in self.players_alive:
+            return
 
-        return self.killed
+        self.killed = username
 
     def GetStart(self):
         return self.start
 
-    async def WaitNight(self):
-        self.waiting()
-
-        while not self.ready_to_wake:
-            await asyncio.sleep(0.001)
+    async def WaitNight(self, username=''):
+        self.Arrive('night', username)
 
-        self.not_waiting()
+        return await self.night.Wait()
 
     def CheckWinner(self):
-        civilians_left = 3
-        for player, role in self.player_roles.items():
-            if role == 'Мафия' and player not in self.players_alive:
-                return 'Мирные'
+        if self.mafia_left == 0:
+            return CIVILIANS_WON
 
-            if role != 'Мафия' and player not in self.players_alive:
-                civilians_left -= 1
+        if self.mafia_left >= self.civilians_left:
+            return MAFIA_WON
 
-        if civilians_left == 1:
-            return 'Мафия'
-        else:
-            return ''
-
-    async def VoteExecute(self, username):
-        self.voted()
+        return ''
 
-        if username:
-            self.execute_votes[username] += 1
-        
-        while not self.end_voting:
-            await asyncio.sleep(0.001)
+    def Vote(self, username):
+        if username not in self.players_alive:
+            return
 
-        max_votes = 0
-        player_executed = ''
+        votes = self.execute_votes.get(username, 0) + 1
+        self.execute_votes[username] = votes
 
-        for player, votes in self.execute_votes.items():
-            if votes > max_votes:
-                max_votes = votes
-                player_executed = player
-            elif votes == max_votes:
-                player_executed = ''
+        if votes > self.leader_votes:
+            self.leader = username
+            self.leader_votes = votes
+            self.tied = False
+        elif votes == self.leader_votes:
+            self.tied = True
 
-        self.know_executed(player_executed)
-
-        return player_executed
+    async def VoteExecute(self, username, voter=''):
+        self.Vote(username)
+        self.Arrive('vote', voter)
 
-    async def PublishMafia(self):
-        for player, role in self.player_roles.items():
-            if role == 'Мафия':
-                self.mafia = player
+        return await self.voting.Wait()
 
-    def GetMafia(self):
-        mafia = self.mafia
+    async def CheckMafia(self, commissar, username):
+        self.checked[commissar] = username
 
-        self.know_mafia()
+        return self.player_roles[username] == MAFIA
 
-        return mafia
+    async def PublishMafia(self, username):
+        if self.player_roles.get(username) == MAFIA:
+            self.mafia = username
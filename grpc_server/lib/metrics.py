@@ -0,0 +1,77 @@
+import time
+
+import grpc
+from prometheus_client import Counter, Gauge, Histogram
+
+RPC_LATENCY = Histogram('mafia_rpc_latency_seconds', 'Time spent handling an RPC', ['method'])
+RPC_IN_FLIGHT = Gauge('mafia_rpc_in_flight', 'RPCs currently being handled', ['method'])
+RPC_ERRORS = Counter('mafia_rpc_errors_total', 'RPCs that ended with an exception', ['method'])
+
+ACTIVE_GAMES = Gauge('mafia_active_games', 'Games currently in progress')
+LOBBY_SIZE = Gauge('mafia_lobby_size', 'Players waiting in open lobbies')
+LOBBY_FILL = Histogram('mafia_lobby_fill_seconds', 'Time from the first player joining a lobby until it is full',
+                       buckets=(0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600))
+PHASE_DURATION = Histogram('mafia_phase_seconds', 'Time until every player of a game has finished a phase', ['phase'],
+                           buckets=(0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600))
+
+
+def ObservePhase(phase, seconds):
+    PHASE_DURATION.labels(phase).observe(seconds)
+
+
+class MetricsInterceptor(grpc.aio.ServerInterceptor):
+    def __init__(self):
+        self.handlers = dict()
+
+    async def intercept_service(self, continuation, handler_call_details):
+        method = handler_call_details.method
+
+        if method not in self.handlers:
+            handler = await continuation(handler_call_details)
+            self.handlers[method] = handler and self.Wrap(method.rsplit('/', 1)[-1], handler)
+
+        return self.handlers[method]
+
+    def Wrap(self, method, handler):
+        latency = RPC_LATENCY.labels(method)
+        in_flight = RPC_IN_FLIGHT.labels(method)
+        errors = RPC_ERRORS.labels(method)
+
+        def Unary(behavior):
+            async def wrapper(request, context):
+                in_flight.inc()
+                start = time.perf_counter()
+                try:
+                    return await behavior(request, context)
+                except Exception:
+                    errors.inc()
+                    raise
+                finally:
+                    latency.observe(time.perf_counter() - start)
+                    in_flight.dec()
+
+            return wrapper
+
+        def Streaming(behavior):
+            async def wrapper(request, context):
+                in_flight.inc()
+                start = time.perf_counter()
+                try:
+                    async for response in behavior(request, context):
+                        yield response
+                except Exception:
+                    errors.inc()
+                    raise
+                finally:
+                    latency.observe(time.perf_counter() - start)
+                    in_flight.dec()
+
+            return wrapper
+
+        if handler.unary_unary:
+            return grpc.unary_unary_rpc_method_handler(Unary(handler.unary_unary), handler.request_deserializer, handler.response_serializer)
+        if handler.stream_unary:
+            return grpc.stream_unary_rpc_method_handler(Unary(handler.stream_unary), handler.request_deserializer, handler.response_serializer)
+        if handler.unary_stream:
+            return grpc.unary_stream_rpc_method_handler(Streaming(handler.unary_stream), handler.request_deserializer, handler.response_serializer)
+        return grpc.stream_stream_rpc_method_handler(Streaming(handler.stream_stream), handler.request_deserializer, handler.response_serializer)
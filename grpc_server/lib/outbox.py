@@ -0,0 +1,82 @@
+import asyncio
+import logging
+
+import httpx
+
+
+logger = logging.getLogger(__name__)
+
+
+class ResultOutbox:
+    def __init__(self, rest_url, graphql_url, batch_size=64, flush_interval=0.05, retries=5, backoff=0.5):
+        self.rest_url = rest_url
+        self.graphql_url = graphql_url
+
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retries = retries
+        self.backoff = backoff
+
+        self.queue = asyncio.Queue()
+
+    def Put(self, game_id, results, scores):
+        self.queue.put_nowait({'game_id': game_id, 'results': results, 'scores': scores})
+
+    async def Run(self):
+        limits = httpx.Limits(max_connections=8, max_keepalive_connections=8)
+
+        async with httpx.AsyncClient(limits=limits, timeout=10) as client:
+            while True:
+                batch = [await self.queue.get()]
+
+                await asyncio.sleep(self.flush_interval)
+
+                while len(batch) < self.batch_size and not self.queue.empty():
+                    batch.append(self.queue.get_nowait())
+
+                try:
+                    await asyncio.gather(
+                        self.Send(client, self.rest_url, self.ResultsBody(batch), len(batch)),
+                        self.Send(client, self.graphql_url, self.GamesBody(batch), len(batch)),
+                    )
+                except Exception:
+                    logger.exception('Failed to report results of %d games', len(batch))
+                finally:
+                    for _ in batch:
+                        self.queue.task_done()
+
+    async def Flush(self, timeout=30):
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.error('Dropping results of %d games on shutdown', self.queue.qsize())
+
+    def ResultsBody(self, batch):
+        return [{'game_id': game['game_id'], 'results': game['results']} for game in batch]
+
+    def GamesBody(self, batch):
+        return [
+            {
+                'id': 'AddGame',
+                'variables': {
+                    'id': game['game_id'],
+                    'players': [result['username'] for result in game['results']],
+                    'scores': game['scores'],
+                },
+            }
+            for game in batch
+        ]
+
+    async def Send(self, client, url, body, games):
+        for attempt in range(self.retries):
+            try:
+                response = await client.post(url, json=body)
+                response.raise_for_status()
+                return
+            except httpx.HTTPError as error:
+                logger.warning('Failed to report results to %s (attempt %d): %s', url, attempt + 1, error)
+
+                if attempt + 1 < self.retries:
+                    await asyncio.sleep(self.backoff * 2 ** attempt)
+
+        logger.error('Dropping results of %d games for %s', games, url)
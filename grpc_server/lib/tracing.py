@@ -0,0 +1,56 @@
+import json
+import os
+import time
+import zlib
+
+
+def Microseconds(monotonic):
+    return int(monotonic * 1_000_000)
+
+
+class GameTrace:
+    def __init__(self, tracer, game_id):
+        self.tracer = tracer
+        self.tid = zlib.crc32(game_id.encode())
+
+        self.Write({'name': 'thread_name', 'ph': 'M', 'args': {'name': game_id}})
+
+    def Write(self, event):
+        self.tracer.Write({'pid': self.tracer.pid, 'tid': self.tid, **event})
+
+    def Span(self, name, start, end, args=None):
+        self.Write({'name': name, 'cat': 'game', 'ph': 'X', 'ts': Microseconds(start), 'dur': Microseconds(end - start), 'args': args or {}})
+
+    def Instant(self, name, args=None):
+        self.Write({'name': name, 'cat': 'game', 'ph': 'i', 's': 't', 'ts': Microseconds(time.monotonic()), 'args': args or {}})
+
+
+class Tracer:
+    def __init__(self, path=None, sample=0.0, pid=0):
+        self.path = path
+        self.sample = sample
+        self.pid = pid
+
+        self.file = None
+
+    def Sampled(self, game_id):
+        return self.sample > 0 and zlib.crc32(game_id.encode()) % 10000 < self.sample * 10000
+
+    def Start(self, game_id):
+        if not self.Sampled(game_id):
+            return None
+
+        return GameTrace(self, game_id)
+
+    def Write(self, event):
+        if self.file is None:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+
+            self.file = open(self.path, 'w', buffering=1)
+            self.file.write('[\n')
+
+        self.file.write(json.dumps(event, ensure_ascii=False) + ',\n')
+
+    def Close(self):
+        if self.file is not None:
+            self.file.close()
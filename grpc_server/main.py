@@ -1,194 +1,557 @@
 import os
+import time
+import signal
+import zlib
 import asyncio
-import requests
+import logging
+import multiprocessing
 from datetime import datetime
 from random import sample
-from copy import copy
 from uuid import uuid4
 
 import grpc
+from prometheus_client import start_http_server
 from google.protobuf.empty_pb2 import Empty
 import proto.mafia_pb2_grpc as proto_grpc
 import proto.mafia_pb2 as proto
 
+from lib.chat_hub import ChatHub, CHANNELS
 from lib.latch import Latch
-from lib.mafia_game import MafiaGame
+from lib import metrics
+from lib.lobby import Lobbies
+from lib.mafia_game import MafiaGame, MakeRoles, MAFIA, COMMISSAR, MAFIA_WON
+from lib.outbox import ResultOutbox
+from lib.tracing import Tracer
 
 
 class Mafia(proto_grpc.MafiaServicer):
-    ROLES = ['Мафия', 'Комиссар', 'Мирный', 'Мирный']
+    ROLES = MakeRoles(
+        int(os.environ.get('ROOM_SIZE', 4)),
+        int(os.environ.get('MAFIA_COUNT', 1)),
+        int(os.environ.get('COMMISSAR_COUNT', 1)),
+    )
 
-    def __init__(self):
-        self.users = set()
+    GAME_TTL = float(os.environ.get('GAME_TTL', 3600))
+    ASSIGNMENT_TTL = float(os.environ.get('ASSIGNMENT_TTL', 60))
+    REAP_INTERVAL = 10
+
+    OPEN_LOBBIES = int(os.environ.get('OPEN_LOBBIES', 1))
+
+    CHAT_HISTORY = int(os.environ.get('CHAT_HISTORY', 50))
+    CHAT_BUFFER = int(os.environ.get('CHAT_BUFFER', 256))
+
+    def __init__(self, outbox, tracer=None):
+        self.outbox = outbox
+        self.tracer = tracer or Tracer()
+
+        self.lobbies = Lobbies(len(self.ROLES), self.ResetUsers, self.OPEN_LOBBIES)
 
         self.games = dict()
-        self.users_to_game_id = dict()
+        self.users_ending = dict()
+        self.assignments = dict()
 
-        self.users_left = Latch(4, self.ResetUsers)
-        self.users_ending = Latch(4, self.DeleteGame)
+        self.chat = ChatHub(self.CHAT_HISTORY, self.CHAT_BUFFER)
 
-    def ResetUsers(self, users):
+    def ResetUsers(self, lobby):
         game_id = str(uuid4())
 
-        users_hash = tuple(sorted(users))
+        users = list(lobby.users)
+
+        roles = dict(zip(users, sample(self.ROLES, k=len(self.ROLES))))
+
+        metrics.LOBBY_FILL.observe(lobby.filled - lobby.opened)
+
+        for user in users:
+            self.assignments[lobby.id, user] = lobby
+
+        self.PlaceGame(lobby, game_id, roles)
+
+    def PlaceGame(self, lobby, game_id, roles):
+        self.AddGame(game_id, roles)
+
+        lobby.Assign(game_id, roles)
+        self.TraceAssigned(game_id, lobby.opened, lobby.filled)
+
+    def TraceAssigned(self, game_id, opened, filled):
+        game = self.games[game_id]
+        if game.trace:
+            game.trace.Span('lobby', opened, filled, {'players': list(game.player_roles)})
+            game.trace.Span('roles', filled, time.monotonic(), {'roles': game.player_roles})
+
+    def AddGame(self, game_id, roles):
+        self.games[game_id] = MafiaGame(roles, metrics.ObservePhase, self.tracer.Start(game_id))
+        self.users_ending[game_id] = Latch(len(roles), self.DeleteGame)
+
+    def GetGame(self, game_id):
+        game = self.games[game_id]
+
+        game.Touch()
+
+        return game
+
+    async def Reap(self):
+        while True:
+            await asyncio.sleep(self.REAP_INTERVAL)
+
+            now = time.monotonic()
 
-        self.users_to_game_id[users_hash] = game_id
+            for key, lobby in list(self.assignments.items()):
+                if now - lobby.filled > self.ASSIGNMENT_TTL:
+                    del self.assignments[key]
 
-        self.games[game_id] = MafiaGame(dict(zip(users, sample(self.ROLES, k=4))))
+            for game_id, game in list(self.games.items()):
+                if now - game.last_active > self.GAME_TTL:
+                    del self.games[game_id]
+                    del self.users_ending[game_id]
 
-        self.users = set()
+                    game.Close(TimeoutError(f'Game {game_id} was inactive for {self.GAME_TTL:.0f}s'))
+
+                    self.chat.Close(game_id, CHANNELS)
+
+    def EndingArrived(self, game, username):
+        if game.trace:
+            game.trace.Instant('get roles', {'player': username})
 
     def DeleteGame(self, game_id, winner, roles, start):
+        time_played = (datetime.now() - start).total_seconds()
+
+        game = self.games.get(game_id)
+        if game and game.trace:
+            game.trace.Span('game over', game.phase_start, time.monotonic(), {'winner': winner})
+
+        results = []
         scores = []
-        if winner == 'Мафия':
-            for player, role in roles.items():
-                if role == 'Мафия':
-                    scores.append(1)
-                    requests.post(f'http://rest_server:13372/result/{player}', params={'won': True, 'time': datetime.now() - start})
-                else:
-                    scores.append(0)
-                    requests.post(f'http://rest_server:13372/result/{player}', params={'won': False, 'time': datetime.now() - start})
-        elif winner == 'Мирные':
-            for player, role in roles.items():
-                if role == 'Мафия':
-                    scores.append(0)
-                    requests.post(f'http://rest_server:13372/result/{player}', params={'won': False, 'time': datetime.now() - start})
-                else:
-                    scores.append(1)
-                    requests.post(f'http://rest_server:13372/result/{player}', params={'won': True, 'time': datetime.now() - start})
-
-        query = f"""
-        {{
-            addGame(id: "{game_id}", players: [{"".join([f'"{player}"' for player in roles])}], scores: {scores})
-        }}
-        """
-
-        requests.post('http://graphql_server:13371/graphql', json={'query': query})
-
-        del self.games[game_id]
+        for player, role in roles.items():
+            won = (role == MAFIA) == (winner == MAFIA_WON)
 
-    async def Connect(self, request, context):
-        username = request.name
+            results.append({'username': player, 'won': won, 'time': time_played})
+            scores.append(int(won))
 
-        users = set()
+        self.outbox.Put(game_id, results, scores)
 
-        self.users.add(username)
+        self.games.pop(game_id, None)
+        self.users_ending.pop(game_id, None)
 
-        while len(users) != 4:
-            if users != self.users:
-                users = copy(self.users)
-                yield proto.Users(username=[proto.Username(name=name) for name in self.users])
+        self.chat.Close(game_id, CHANNELS)
 
-            await asyncio.sleep(0.001)
+    async def Connect(self, request, context):
+        username = request.name
 
-        self.users_left(users)
+        lobby = self.lobbies.Join(username)
+
+        try:
+            async for users in lobby.Watch(username):
+                yield proto.Users(username=[proto.Username(name=name) for name in users], capacity=lobby.capacity, lobby_id=lobby.id)
+        except asyncio.CancelledError:
+            self.lobbies.Leave(username)
+            raise
 
     async def Disconnect(self, request, context):
         username = request.name
 
-        self.users.remove(username)
+        self.lobbies.Leave(username)
 
         return Empty()
 
     async def StartGame(self, request, context):
-        players = [player.name for player in request.players.username]
-
-        users = tuple(sorted(players))
-
-        while users not in self.users_to_game_id:
-            await asyncio.sleep(0.001)
+        lobby = self.assignments.pop((request.players.lobby_id, request.player.name), None)
+        if lobby is None:
+            await context.abort(grpc.StatusCode.NOT_FOUND, 'Player is not assigned to a game')
 
-        game_id = self.users_to_game_id[users]
+        try:
+            game_id = await lobby.GetGameId()
+        except Exception as error:
+            await context.abort(grpc.StatusCode.UNAVAILABLE, f'Game could not be created: {error}')
 
-        game = self.games[game_id]
-
-        role = await game.GetPlayerRole(request.player.name)
+        role = lobby.roles[request.player.name]
 
         return proto.StartGameResponse(game_id=game_id, role=role)
 
     async def EndDay(self, request, context):
-        game = self.games[request.game_id]
+        game = self.GetGame(request.game_id)
 
         player_role = await game.GetPlayerRole(request.username.name)
 
-        if player_role in ['Комиссар', 'Мафия']:
+        if player_role in [COMMISSAR, MAFIA] and request.username.name in await game.GetPlayersAlive():
             return proto.EndDayResponse(do_action=True)
         else:
             return proto.EndDayResponse(do_action=False)
 
     async def GetPlayersAlive(self, request, context):
-        game = self.games[request.game_id]
+        game = self.GetGame(request.game_id)
 
         users = await game.GetPlayersAlive()
 
         return proto.Users(username=[proto.Username(name=username) for username in users])
 
     async def CheckMafia(self, request, context):
-        game = self.games[request.info.game_id]
+        game = self.GetGame(request.info.game_id)
         player = request.player.name
 
-        role = await game.GetPlayerRole(player)
+        is_mafia = await game.CheckMafia(request.info.username.name, player)
 
-        return proto.CheckMafiaResponse(is_mafia=role == 'Мафия')
+        return proto.CheckMafiaResponse(is_mafia=is_mafia)
 
     async def PublishMafia(self, request, context):
-        game = self.games[request.game_id]
+        game = self.GetGame(request.game_id)
 
-        await game.PublishMafia()
+        await game.PublishMafia(game.checked.pop(request.username.name, ''))
 
         return Empty()
 
     async def Kill(self, request, context):
-        game = self.games[request.info.game_id]
+        game = self.GetGame(request.info.game_id)
         player = request.player.name
 
-        await game.SetKilled(player)
+        await game.SetKilled(player, request.info.username.name)
 
         return Empty()
 
     async def EndNight(self, request, context):
-        game = self.games[request.game_id]
-
-        await game.WaitNight()
-
-        mafia = game.GetMafia()
+        game = self.GetGame(request.game_id)
 
-        killed = game.GetKilled()
+        killed, mafia = await game.WaitNight(request.username.name)
 
         return proto.EndNightResponse(killed=proto.Username(name=killed), mafia=proto.Username(name=mafia))
 
     async def CheckWinner(self, request, context):
-        game = self.games[request.game_id]
+        game = self.GetGame(request.game_id)
 
         winner = game.CheckWinner()
 
         return proto.Winner(winner=winner)
 
     async def Execute(self, request, context):
-        game = self.games[request.info.game_id]
+        game = self.GetGame(request.info.game_id)
 
-        player_excuted = await game.VoteExecute(request.player.name)
+        player_excuted = await game.VoteExecute(request.player.name, request.info.username.name)
 
         return proto.Username(name=player_excuted)
 
     async def GetRoles(self, request, context):
-        game = self.games[request.game_id]
+        game = self.GetGame(request.game_id)
 
         roles = game.GetRoles()
 
-        self.users_ending(request.game_id, game.CheckWinner(), roles, game.GetStart())
+        self.EndingArrived(game, request.username.name)
+        self.users_ending[request.game_id](request.game_id, game.CheckWinner(), roles, game.GetStart())
 
         return proto.Roles(roles=roles)
 
+    async def NextAction(self, actions, kind, context):
+        action = await anext(actions, None)
+        if action is None or action.WhichOneof('action') != kind:
+            await context.abort(grpc.StatusCode.INVALID_ARGUMENT, f'Expected {kind} action')
+
+        return getattr(action, kind)
+
+    async def PhaseChange(self, phase, game):
+        users = await game.GetPlayersAlive()
+
+        return proto.SessionEvent(phase=proto.PhaseChange(phase=phase, alive=proto.Users(username=[proto.Username(name=username) for username in users])))
+
+    def GameOver(self, game_id, game, winner, username):
+        roles = game.GetRoles()
+
+        self.EndingArrived(game, username)
+
+        self.users_ending[game_id](game_id, winner, roles, game.GetStart())
+
+        return proto.SessionEvent(game_over=proto.GameOver(winner=winner, roles=roles))
+
+    async def GameSession(self, request_iterator, context):
+        join = await self.NextAction(request_iterator, 'join', context)
+
+        game_id = join.game_id
+        username = join.username.name
+
+        game = self.GetGame(game_id)
+
+        role = await game.GetPlayerRole(username)
+
+        while True:
+            game.Touch()
+
+            yield await self.PhaseChange(proto.DAY, game)
+            yield await self.PhaseChange(proto.NIGHT, game)
+
+            alive = username in await game.GetPlayersAlive()
+
+            if alive and role == COMMISSAR:
+                player = await self.NextAction(request_iterator, 'check', context)
+
+                is_mafia = await game.CheckMafia(username, player.name)
+                yield proto.SessionEvent(check=proto.CheckMafiaResponse(is_mafia=is_mafia))
+
+                if is_mafia and await self.NextAction(request_iterator, 'publish', context):
+                    await game.PublishMafia(player.name)
+            elif alive and role == MAFIA:
+                player = await self.NextAction(request_iterator, 'kill', context)
+
+                await game.SetKilled(player.name, username)
+
+            killed, mafia = await game.WaitNight(username)
+
+            yield proto.SessionEvent(night=proto.EndNightResponse(killed=proto.Username(name=killed), mafia=proto.Username(name=mafia)))
+
+            winner = game.CheckWinner()
+            if winner:
+                yield self.GameOver(game_id, game, winner, username)
+                return
+
+            yield await self.PhaseChange(proto.VOTE, game)
+
+            player = await self.NextAction(request_iterator, 'vote', context)
+
+            players_alive = await game.GetPlayersAlive()
+            executed = await game.VoteExecute(player.name if username in players_alive else '', username)
 
-async def serve():
-    server = grpc.aio.server()
-    proto_grpc.add_MafiaServicer_to_server(Mafia(), server)
+            yield proto.SessionEvent(executed=proto.Username(name=executed))
+
+            winner = game.CheckWinner()
+            if winner:
+                yield self.GameOver(game_id, game, winner, username)
+                return
+
+    async def ReadChat(self, actions, game, info, channel, queue):
+        username = info.username.name
+
+        async for action in actions:
+            if action.WhichOneof('action') == 'text' and username in await game.GetPlayersAlive():
+                self.chat.Publish(info.game_id, channel, proto.ChatMessage(username=username, text=action.text))
+
+        self.chat.Push(queue, None)
+
+    async def Chat(self, request_iterator, context):
+        join = await self.NextAction(request_iterator, 'join', context)
+
+        game = self.games.get(join.info.game_id)
+        if game is None:
+            await context.abort(grpc.StatusCode.NOT_FOUND, 'Game not found')
+
+        role = game.GetRoles().get(join.info.username.name)
+        if join.channel not in CHANNELS or role is None or (join.channel == 'mafia' and role != MAFIA):
+            await context.abort(grpc.StatusCode.PERMISSION_DENIED, f'Player can not join {join.channel} chat')
+
+        queue = self.chat.Subscribe(join.info.game_id, join.channel)
+        reader = asyncio.create_task(self.ReadChat(request_iterator, game, join.info, join.channel, queue))
+
+        try:
+            while True:
+                message = await queue.get()
+                if message is None:
+                    return
+
+                yield message
+        finally:
+            reader.cancel()
+            self.chat.Unsubscribe(join.info.game_id, join.channel, queue)
+
+
+async def prepend(first, rest):
+    yield first
+
+    async for item in rest:
+        yield item
+
+
+def Routed(name, get_game_id):
+    async def method(self, request, context):
+        owner = self.Owner(get_game_id(request))
+        if owner == self.index:
+            return await getattr(Mafia, name)(self, request, context)
+
+        try:
+            return await getattr(self.peers[owner], name)(request, wait_for_ready=True)
+        except grpc.aio.AioRpcError as error:
+            await context.abort(error.code(), error.details())
+
+    return method
+
+
+class ShardedMafia(Mafia, proto_grpc.MafiaShardServicer):
+    LOBBY_WORKER = 0
+    SHARD_PORT = int(os.environ.get('SHARD_PORT', 50100))
+    PLACE_TIMEOUT = float(os.environ.get('PLACE_TIMEOUT', 10))
+
+    def __init__(self, outbox, index, workers, tracer=None):
+        super().__init__(outbox, tracer)
+
+        self.index = index
+        self.workers = workers
+
+        channels = [grpc.aio.insecure_channel(self.ShardAddress(i)) for i in range(workers)]
+        self.peers = [proto_grpc.MafiaStub(channel) for channel in channels]
+        self.shards = [proto_grpc.MafiaShardStub(channel) for channel in channels]
+
+        self.placing = set()
+
+    @classmethod
+    def ShardAddress(cls, index):
+        return f'127.0.0.1:{cls.SHARD_PORT + index}'
+
+    def Owner(self, game_id):
+        return zlib.crc32(game_id.encode()) % self.workers
+
+    def PlaceGame(self, lobby, game_id, roles):
+        owner = self.Owner(game_id)
+        if owner == self.index:
+            return super().PlaceGame(lobby, game_id, roles)
+
+        task = asyncio.create_task(self.PlaceRemoteGame(owner, lobby, game_id, roles))
+        self.placing.add(task)
+        task.add_done_callback(self.placing.discard)
+
+    async def PlaceRemoteGame(self, owner, lobby, game_id, roles):
+        try:
+            setup = proto.GameSetup(game_id=game_id, roles=roles, lobby_opened=lobby.opened, lobby_filled=lobby.filled)
+            await self.shards[owner].CreateGame(setup, wait_for_ready=True, timeout=self.PLACE_TIMEOUT)
+        except Exception as error:
+            logging.warning('Could not place game %s on worker %d: %s', game_id, owner, error)
+            lobby.Fail(error)
+            return
+
+        lobby.Assign(game_id, roles)
+
+    async def CreateGame(self, request, context):
+        self.AddGame(request.game_id, dict(request.roles))
+        self.TraceAssigned(request.game_id, request.lobby_opened, request.lobby_filled)
+
+        return Empty()
+
+    async def Connect(self, request, context):
+        if self.index == self.LOBBY_WORKER:
+            async for users in super().Connect(request, context):
+                yield users
+        else:
+            async for users in self.peers[self.LOBBY_WORKER].Connect(request, wait_for_ready=True):
+                yield users
+
+    async def Disconnect(self, request, context):
+        if self.index == self.LOBBY_WORKER:
+            return await super().Disconnect(request, context)
+
+        return await self.peers[self.LOBBY_WORKER].Disconnect(request, wait_for_ready=True)
+
+    async def StartGame(self, request, context):
+        if self.index == self.LOBBY_WORKER:
+            return await super().StartGame(request, context)
+
+        try:
+            return await self.peers[self.LOBBY_WORKER].StartGame(request, wait_for_ready=True)
+        except grpc.aio.AioRpcError as error:
+            await context.abort(error.code(), error.details())
+
+    async def GameSession(self, request_iterator, context):
+        first = await anext(request_iterator, None)
+        if first is None or first.WhichOneof('action') != 'join':
+            await context.abort(grpc.StatusCode.INVALID_ARGUMENT, 'Expected join action')
+
+        actions = prepend(first, request_iterator)
+
+        owner = self.Owner(first.join.game_id)
+        if owner == self.index:
+            async for event in super().GameSession(actions, context):
+                yield event
+        else:
+            async for event in self.peers[owner].GameSession(actions, wait_for_ready=True):
+                yield event
+
+    async def Chat(self, request_iterator, context):
+        first = await anext(request_iterator, None)
+        if first is None or first.WhichOneof('action') != 'join':
+            await context.abort(grpc.StatusCode.INVALID_ARGUMENT, 'Expected join action')
+
+        actions = prepend(first, request_iterator)
+
+        owner = self.Owner(first.join.info.game_id)
+        if owner == self.index:
+            async for message in super().Chat(actions, context):
+                yield message
+        else:
+            async for message in self.peers[owner].Chat(actions, wait_for_ready=True):
+                yield message
+
+    EndDay = Routed('EndDay', lambda request: request.game_id)
+    GetPlayersAlive = Routed('GetPlayersAlive', lambda request: request.game_id)
+    CheckMafia = Routed('CheckMafia', lambda request: request.info.game_id)
+    PublishMafia = Routed('PublishMafia', lambda request: request.game_id)
+    Kill = Routed('Kill', lambda request: request.info.game_id)
+    EndNight = Routed('EndNight', lambda request: request.game_id)
+    CheckWinner = Routed('CheckWinner', lambda request: request.game_id)
+    Execute = Routed('Execute', lambda request: request.info.game_id)
+    GetRoles = Routed('GetRoles', lambda request: request.game_id)
+
+
+async def serve(index=0, workers=1):
+    outbox = ResultOutbox(
+        f'{os.environ.get("REST_SERVER_URL", "http://rest_server:13372")}/results',
+        f'{os.environ.get("GRAPHQL_SERVER_URL", "http://graphql_server:13371")}/graphql',
+    )
+
+    server = grpc.aio.server(interceptors=[metrics.MetricsInterceptor()], options=[('grpc.so_reuseport', 1)])
+    tracer = Tracer(
+        os.path.join(os.environ.get('TRACE_DIR', 'traces'), f'trace-{index}.json'),
+        float(os.environ.get('TRACE_SAMPLE', 0)),
+        index,
+    )
+
+    if workers == 1:
+        mafia = Mafia(outbox, tracer)
+    else:
+        mafia = ShardedMafia(outbox, index, workers, tracer)
+        proto_grpc.add_MafiaShardServicer_to_server(mafia, server)
+        server.add_insecure_port(mafia.ShardAddress(index))
+
+    metrics.ACTIVE_GAMES.set_function(lambda: len(mafia.games))
+    metrics.LOBBY_SIZE.set_function(mafia.lobbies.Size)
+    start_http_server(int(os.environ.get('METRICS_PORT', 9100)) + index)
+    proto_grpc.add_MafiaServicer_to_server(mafia, server)
     listen_addr = f'0.0.0.0:{os.environ.get("SERVER_PORT", 50051)}'
     server.add_insecure_port(listen_addr)
     await server.start()
-    await server.wait_for_termination()
+
+    grace = float(os.environ.get('SHUTDOWN_GRACE', 5))
+    loop = asyncio.get_running_loop()
+    for signum in [signal.SIGTERM, signal.SIGINT]:
+        loop.add_signal_handler(signum, lambda: asyncio.ensure_future(server.stop(grace)))
+
+    reaper = asyncio.create_task(mafia.Reap())
+    reporter = asyncio.create_task(outbox.Run())
+    try:
+        await server.wait_for_termination()
+    finally:
+        reaper.cancel()
+        await outbox.Flush()
+        reporter.cancel()
+        tracer.Close()
+
+
+def run_worker(index, workers):
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(serve(index, workers))
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+
+    workers = int(os.environ.get('SERVER_WORKERS', 1)) or os.cpu_count()
+    if workers == 1:
+        asyncio.run(serve())
+        return
+
+    context = multiprocessing.get_context('spawn')
+    processes = [context.Process(target=run_worker, args=(index, workers)) for index in range(workers)]
+
+    for process in processes:
+        process.start()
+
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, lambda signum, frame: [process.terminate() for process in processes])
+
+    for process in processes:
+        process.join()
 
 
 if __name__ == '__main__':
-    asyncio.run(serve())
+    main()
@@ -0,0 +1,177 @@
+import time
+from argparse import ArgumentParser
+
+import numpy as np
+
+from lib.mafia_game import MAFIA, COMMISSAR, MAFIA_WON, CIVILIANS_WON
+from main import Mafia
+
+NOBODY = 0
+MAFIA_WIN = 1
+CIVILIANS_WIN = 2
+
+
+def choose(rng, allowed):
+    scores = rng.random(allowed.shape)
+    scores[~allowed] = -1
+
+    return np.where(allowed.any(axis=-1), scores.argmax(axis=-1), -1)
+
+
+def check_winner(alive, is_mafia):
+    mafia_left = (alive & is_mafia).sum(axis=1)
+    civilians_left = (alive & ~is_mafia).sum(axis=1)
+
+    return np.where(mafia_left == 0, CIVILIANS_WIN, np.where(mafia_left >= civilians_left, MAFIA_WIN, NOBODY))
+
+
+def night(rng, alive, known, revealed, is_mafia, commissars, informed, publish):
+    games, players = alive.shape
+    rows = np.arange(games)
+
+    killer = players - 1 - (alive & is_mafia)[:, ::-1].argmax(axis=1)
+
+    allowed = alive.copy()
+    allowed[rows, killer] = False
+    if informed:
+        allowed &= ~is_mafia
+
+    killed = choose(rng, allowed)
+
+    announced = np.full(games, -1)
+
+    for index, commissar in enumerate(commissars):
+        allowed = alive.copy()
+        allowed[:, commissar] = False
+        if informed:
+            allowed &= ~known[:, index]
+
+        checked = choose(rng, allowed)
+
+        checking = alive[:, commissar] & (checked >= 0)
+        checking_rows, checked = rows[checking], checked[checking]
+
+        known[checking_rows, index, checked] = True
+
+        published = is_mafia[checked] & (rng.random(len(checking_rows)) < publish)
+        announced[checking_rows[published]] = checked[published]
+
+    announcing = announced >= 0
+    revealed[rows[announcing], announced[announcing]] = True
+
+    hit = killed >= 0
+    alive[np.flatnonzero(hit), killed[hit]] = False
+
+
+def vote(rng, alive, known, revealed, is_mafia, commissars, informed):
+    games, players = alive.shape
+    rows = np.arange(games)
+
+    allowed = np.empty((games, players, players + 1), bool)
+    allowed[:, :, :players] = alive[:, None, :] & ~np.eye(players, dtype=bool)
+    allowed[:, :, players] = not informed
+
+    votes = choose(rng, allowed)
+
+    if informed:
+        suspects = revealed & alive
+        suspect = np.where(suspects.any(axis=1), suspects.argmax(axis=1), -1)
+        votes = np.where((suspect >= 0)[:, None] & ~is_mafia, suspect[:, None], votes)
+
+        for index, commissar in enumerate(commissars):
+            found = known[:, index] & is_mafia & alive
+            votes[:, commissar] = np.where(found.any(axis=1), found.argmax(axis=1), votes[:, commissar])
+
+        victim = choose(rng, alive & ~is_mafia)
+        votes = np.where(is_mafia, victim[:, None], votes)
+
+    votes = np.where(alive & (votes >= 0) & (votes < players), votes, players)
+
+    counts = np.bincount((rows[:, None] * (players + 1) + votes).ravel(), minlength=games * (players + 1))
+    counts = counts.reshape(games, players + 1)[:, :players]
+
+    top = counts.max(axis=1)
+    leaders = (counts == top[:, None]).sum(axis=1)
+
+    executed = (top > 0) & (leaders == 1)
+    alive[np.flatnonzero(executed), counts.argmax(axis=1)[executed]] = False
+
+
+def simulate(rng, roles, games, strategy, publish):
+    players = len(roles)
+    is_mafia = np.array([role == MAFIA for role in roles])
+    commissars = [index for index, role in enumerate(roles) if role == COMMISSAR]
+    informed = strategy == 'informed'
+
+    alive = np.ones((games, players), bool)
+    known = np.zeros((games, len(commissars), players), bool)
+    revealed = np.zeros((games, players), bool)
+
+    winner = np.zeros(games, np.int8)
+    rounds = np.zeros(games, np.int32)
+
+    for round in range(1, players + 1):
+        active = np.flatnonzero(winner == NOBODY)
+        if not len(active):
+            break
+
+        rounds[active] = round
+
+        state = alive[active], known[active], revealed[active]
+        night(rng, *state, is_mafia, commissars, informed, publish)
+
+        winner[active] = check_winner(state[0], is_mafia)
+        playing = winner[active] == NOBODY
+
+        day = tuple(array[playing] for array in state)
+        vote(rng, *day, is_mafia, commissars, informed)
+
+        for array, value in zip(state, day):
+            array[playing] = value
+        winner[active[playing]] = check_winner(day[0], is_mafia)
+
+        alive[active], known[active], revealed[active] = state
+
+    return winner, rounds
+
+
+def main():
+    parser = ArgumentParser(description='Monte Carlo simulation of mafia games for role balance analysis')
+    parser.add_argument('--games', type=int, default=1000000)
+    parser.add_argument('--batch', type=int, default=100000)
+    parser.add_argument('--roles', nargs='+', default=Mafia.ROLES)
+    parser.add_argument('--strategy', choices=['random', 'informed'], default='random')
+    parser.add_argument('--publish', type=float, default=0.5)
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+
+    wins = np.zeros(3, np.int64)
+    lengths = np.zeros(len(args.roles) + 1, np.int64)
+
+    start = time.perf_counter()
+
+    for offset in range(0, args.games, args.batch):
+        winner, rounds = simulate(rng, args.roles, min(args.batch, args.games - offset), args.strategy, args.publish)
+
+        wins += np.bincount(winner, minlength=3)
+        lengths += np.bincount(rounds, minlength=len(lengths))
+
+    elapsed = time.perf_counter() - start
+
+    print(f'{args.games} games ({args.strategy}, roles: {", ".join(args.roles)}) in {elapsed:.2f}s')
+
+    for name, index in [(MAFIA_WON, MAFIA_WIN), (CIVILIANS_WON, CIVILIANS_WIN)]:
+        rate = wins[index] / args.games
+        error = 1.96 * np.sqrt(rate * (1 - rate) / args.games)
+        print(f'{name:>8}: {rate * 100:6.2f}% ± {error * 100:.2f}%')
+
+    print(f'mean length: {(lengths * np.arange(len(lengths))).sum() / args.games:.3f} rounds')
+    for round, count in enumerate(lengths):
+        if count:
+            print(f'{round:>8}: {count / args.games * 100:6.2f}%')
+
+
+if __name__ == '__main__':
+    main()
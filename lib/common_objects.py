@@ -13,3 +13,21 @@ class PlayerStatistics(BaseModel):
     games_won: int
     games_lost: int
     time_played: timedelta
+
+class PlayerResult(BaseModel):
+    username: str
+    won: bool
+    time: timedelta
+
+class GameResult(BaseModel):
+    game_id: str
+    results: list[PlayerResult]
+
+class LeaderboardEntry(BaseModel):
+    rank: int
+    username: str
+    score: float
+
+class ProfileQuery(BaseModel):
+    usernames: list[str]
+    fields: list[str] | None = None
@@ -0,0 +1,184 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from hashlib import sha256
+from io import BytesIO
+
+import httpx
+from PIL import Image, ImageOps
+
+
+logger = logging.getLogger(__name__)
+
+AVATAR_SIZE = (256, 256)
+
+
+def normalize(data: bytes) -> bytes:
+    image = ImageOps.fit(Image.open(BytesIO(data)).convert('RGB'), AVATAR_SIZE)
+
+    normalized = BytesIO()
+    image.save(normalized, format='PNG')
+
+    return normalized.getvalue()
+
+
+class AvatarCache:
+    def __init__(self, directory: str, max_bytes: int, client: httpx.AsyncClient | None = None, retry_after: float = 300):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.client = client or httpx.AsyncClient(timeout=10, follow_redirects=True)
+        self.retry_after = retry_after
+
+        self.urls: OrderedDict[str, str] = OrderedDict()
+        self.sizes: dict[str, int] = dict()
+        self.references: dict[str, int] = dict()
+        self.pinned: dict[str, int] = dict()
+        self.total_bytes = 0
+        self.fetching: dict[str, asyncio.Task] = dict()
+        self.failed: dict[str, float] = dict()
+
+        os.makedirs(directory, exist_ok=True)
+        self.load()
+
+        self.index_file = open(self.index_path(), 'a')
+
+    def path(self, content_hash: str) -> str:
+        return os.path.join(self.directory, f'{content_hash}.png')
+
+    def index_path(self) -> str:
+        return os.path.join(self.directory, 'index.jsonl')
+
+    def load(self) -> None:
+        urls: OrderedDict[str, str] = OrderedDict()
+
+        if os.path.exists(self.index_path()):
+            with open(self.index_path()) as index_file:
+                for line in index_file:
+                    try:
+                        url, content_hash = json.loads(line)
+                    except ValueError:
+                        break
+
+                    urls[url] = content_hash
+                    urls.move_to_end(url)
+
+        files = set()
+        for name in os.listdir(self.directory):
+            if name.endswith('.png'):
+                files.add(name.removesuffix('.png'))
+            elif name.endswith('.tmp'):
+                os.remove(os.path.join(self.directory, name))
+
+        for url, content_hash in urls.items():
+            if content_hash in files:
+                self.add(url, content_hash, os.path.getsize(self.path(content_hash)))
+
+        for content_hash in files - self.sizes.keys():
+            os.remove(self.path(content_hash))
+
+        self.evict()
+
+        temporary_path = f'{self.index_path()}.tmp'
+        with open(temporary_path, 'w') as index_file:
+            for url, content_hash in self.urls.items():
+                index_file.write(json.dumps([url, content_hash]))
+                index_file.write('\n')
+
+        os.replace(temporary_path, self.index_path())
+
+    def prefetch(self, url: str) -> None:
+        if url in self.urls or url in self.fetching:
+            return
+
+        self.failed.pop(url, None)
+        self.fetching[url] = asyncio.create_task(self.fetch(url))
+
+    def pin(self, url: str) -> str | None:
+        content_hash = self.urls.get(url)
+        if content_hash is None:
+            if time.monotonic() - self.failed.get(url, float('-inf')) >= self.retry_after:
+                self.prefetch(url)
+            return None
+
+        self.urls.move_to_end(url)
+        self.references[content_hash] += 1
+        self.pinned[content_hash] = self.pinned.get(content_hash, 0) + 1
+
+        return content_hash
+
+    def unpin(self, content_hash: str) -> None:
+        self.pinned[content_hash] -= 1
+        if self.pinned[content_hash] == 0:
+            del self.pinned[content_hash]
+
+        self.release(content_hash)
+        self.evict()
+
+    async def fetch(self, url: str) -> None:
+        try:
+            response = await self.client.get(url)
+            response.raise_for_status()
+
+            avatar = await asyncio.get_running_loop().run_in_executor(None, normalize, response.content)
+        except Exception as error:
+            logger.warning('Failed to fetch avatar %s: %s', url, error)
+            self.failed[url] = time.monotonic()
+            return
+        finally:
+            self.fetching.pop(url, None)
+
+        content_hash = sha256(avatar).hexdigest()
+
+        if content_hash not in self.sizes:
+            temporary_path = f'{self.path(content_hash)}.tmp'
+            with open(temporary_path, 'wb') as avatar_file:
+                avatar_file.write(avatar)
+            os.replace(temporary_path, self.path(content_hash))
+
+        self.add(url, content_hash, len(avatar))
+
+        self.index_file.write(json.dumps([url, content_hash]))
+        self.index_file.write('\n')
+        self.index_file.flush()
+
+        self.evict()
+
+    def add(self, url: str, content_hash: str, size: int) -> None:
+        if content_hash not in self.sizes:
+            self.sizes[content_hash] = size
+            self.references[content_hash] = 0
+            self.total_bytes += size
+
+        if url in self.urls:
+            self.release(self.urls[url])
+
+        self.urls[url] = content_hash
+        self.urls.move_to_end(url)
+        self.references[content_hash] += 1
+
+    def evict(self) -> None:
+        if self.total_bytes <= self.max_bytes:
+            return
+
+        for url, content_hash in list(self.urls.items()):
+            if self.total_bytes <= self.max_bytes:
+                break
+
+            if content_hash not in self.pinned:
+                del self.urls[url]
+                self.release(content_hash)
+
+    def release(self, content_hash: str) -> None:
+        self.references[content_hash] -= 1
+        if self.references[content_hash] == 0:
+            del self.references[content_hash]
+            self.total_bytes -= self.sizes.pop(content_hash)
+            os.remove(self.path(content_hash))
+
+    async def close(self) -> None:
+        await self.client.aclose()
+
+        self.index_file.close()
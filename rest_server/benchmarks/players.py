@@ -0,0 +1,83 @@
+import time
+import tracemalloc
+from argparse import ArgumentParser
+from datetime import timedelta
+
+from lib.common_objects import PlayerProfile, PlayerStatistics
+from players import PlayerTable
+
+
+SEXES = ['male', 'female']
+PICTURE = 'https://example.com/avatar.png'
+
+
+def fill_models(count):
+    players = dict()
+
+    for i in range(count):
+        username = f'player{i}'
+        profile = PlayerProfile(username=username, picture=PICTURE, sex=SEXES[i % 2], email=f'{username}@example.com')
+        players[username] = PlayerStatistics(profile=profile, games_played=0, games_won=0, games_lost=0, time_played=timedelta())
+
+    return players
+
+
+def fill_table(count):
+    players = PlayerTable()
+
+    for i in range(count):
+        username = f'player{i}'
+        players.add(username, PICTURE, SEXES[i % 2], f'{username}@example.com')
+
+    return players
+
+
+def update_models(players, usernames):
+    time_played = timedelta(minutes=5)
+
+    for i, username in enumerate(usernames):
+        statistics = players[username]
+        statistics.games_played += 1
+        if i % 2:
+            statistics.games_won += 1
+        else:
+            statistics.games_lost += 1
+        statistics.time_played += time_played
+
+
+def update_table(players, usernames):
+    for i, username in enumerate(usernames):
+        players.add_result(username, bool(i % 2), 300_000_000)
+
+
+def measure(name, fill, update, count, updates):
+    tracemalloc.start()
+
+    start = time.perf_counter()
+    players = fill(count)
+    fill_seconds = time.perf_counter() - start
+
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    usernames = [f'player{i % count}' for i in range(updates)]
+
+    start = time.perf_counter()
+    update(players, usernames)
+    update_seconds = time.perf_counter() - start
+
+    print(f'{name:>8}: {memory / count:.0f} bytes/player, {count / fill_seconds:.0f} registrations/sec, {updates / update_seconds:.0f} results/sec')
+
+
+def main():
+    parser = ArgumentParser(description='Memory and throughput of player storage')
+    parser.add_argument('--players', type=int, default=1_000_000)
+    parser.add_argument('--updates', type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    measure('pydantic', fill_models, update_models, args.players, args.updates)
+    measure('table', fill_table, update_table, args.players, args.updates)
+
+
+if __name__ == '__main__':
+    main()
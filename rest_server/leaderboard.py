@@ -0,0 +1,158 @@
+from bisect import bisect_left, insort
+from typing import Iterator
+
+
+class RankedSet:
+    LOAD = 1000
+
+    def __init__(self, keys: list = ()):
+        keys = sorted(keys)
+
+        self.buckets = [keys[i:i + self.LOAD] for i in range(0, len(keys), self.LOAD)]
+        self.maxes = [bucket[-1] for bucket in self.buckets]
+        self.reindex()
+
+    def reindex(self) -> None:
+        self.tree = [0] + [len(bucket) for bucket in self.buckets]
+
+        for i in range(1, len(self.tree)):
+            parent = i + (i & -i)
+            if parent < len(self.tree):
+                self.tree[parent] += self.tree[i]
+
+    def resize(self, bucket: int, delta: int) -> None:
+        i = bucket + 1
+        while i < len(self.tree):
+            self.tree[i] += delta
+            i += i & -i
+
+    def before(self, bucket: int) -> int:
+        count = 0
+
+        i = bucket
+        while i > 0:
+            count += self.tree[i]
+            i -= i & -i
+
+        return count
+
+    def locate(self, index: int) -> tuple[int, int]:
+        bucket = 0
+
+        step = 1 << (len(self.tree) - 1).bit_length()
+        while step:
+            if bucket + step < len(self.tree) and self.tree[bucket + step] <= index:
+                bucket += step
+                index -= self.tree[bucket]
+            step >>= 1
+
+        return bucket, index
+
+    def __len__(self) -> int:
+        return self.before(len(self.buckets))
+
+    def add(self, key) -> None:
+        if not self.buckets:
+            self.buckets.append([key])
+            self.maxes.append(key)
+            self.reindex()
+            return
+
+        i = min(bisect_left(self.maxes, key), len(self.buckets) - 1)
+
+        bucket = self.buckets[i]
+        insort(bucket, key)
+        self.maxes[i] = bucket[-1]
+
+        if len(bucket) > 2 * self.LOAD:
+            self.buckets[i:i + 1] = [bucket[:self.LOAD], bucket[self.LOAD:]]
+            self.maxes[i:i + 1] = [bucket[self.LOAD - 1], bucket[-1]]
+            self.reindex()
+        else:
+            self.resize(i, 1)
+
+    def remove(self, key) -> None:
+        i = bisect_left(self.maxes, key)
+
+        bucket = self.buckets[i]
+        del bucket[bisect_left(bucket, key)]
+
+        if bucket:
+            self.maxes[i] = bucket[-1]
+            self.resize(i, -1)
+        else:
+            del self.buckets[i]
+            del self.maxes[i]
+            self.reindex()
+
+    def rank(self, key) -> int:
+        i = bisect_left(self.maxes, key)
+        if i == len(self.buckets):
+            return len(self)
+
+        return self.before(i) + bisect_left(self.buckets[i], key)
+
+    def items_from(self, index: int) -> Iterator:
+        bucket, position = self.locate(index)
+
+        for i in range(bucket, len(self.buckets)):
+            yield from self.buckets[i][position:]
+            position = 0
+
+
+METRICS = ('wins', 'win_rate', 'time_played')
+
+
+def make_keys(username: str, games_played: int, games_won: int, time_played: int) -> tuple[tuple, tuple, tuple]:
+    win_rate = games_won / games_played if games_played else 0.0
+
+    return (-games_won, username), (-win_rate, username), (-time_played / 1e6, username)
+
+
+class Leaderboard:
+    def __init__(self, players: dict[str, tuple[int, int, int]] = None):
+        players = players or dict()
+
+        self.keys = {username: make_keys(username, *counters) for username, counters in players.items()}
+
+        self.rankings = {metric: RankedSet([keys[i] for keys in self.keys.values()]) for i, metric in enumerate(METRICS)}
+
+    def update(self, username: str, games_played: int, games_won: int, time_played: int) -> None:
+        keys = make_keys(username, games_played, games_won, time_played)
+        old_keys = self.keys.get(username)
+
+        for i, metric in enumerate(METRICS):
+            if old_keys is not None:
+                if old_keys[i] == keys[i]:
+                    continue
+                self.rankings[metric].remove(old_keys[i])
+
+            self.rankings[metric].add(keys[i])
+
+        self.keys[username] = keys
+
+    def remove(self, username: str) -> None:
+        keys = self.keys.pop(username, None)
+        if keys is None:
+            return
+
+        for i, metric in enumerate(METRICS):
+            self.rankings[metric].remove(keys[i])
+
+    def top(self, metric: str, count: int, offset: int = 0) -> list[tuple[int, str, float]]:
+        entries = []
+
+        for rank, (score, username) in enumerate(self.rankings[metric].items_from(offset), offset + 1):
+            if len(entries) == count:
+                break
+            entries.append((rank, username, -score))
+
+        return entries
+
+    def rank(self, metric: str, username: str) -> tuple[int, float] | None:
+        if username not in self.keys:
+            return None
+
+        key = self.keys[username][METRICS.index(metric)]
+
+        return self.rankings[metric].rank(key) + 1, -key[0]
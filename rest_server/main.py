@@ -1,60 +1,185 @@
+import gc
+import json
+import os
 import uvicorn
 import asyncio
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import FileResponse
-from lib.common_objects import PlayerProfile, PlayerStatistics
+import multiprocessing
+from hashlib import md5
+from io import BytesIO
+from itertools import chain
+from typing import AsyncIterator, Literal
+from fastapi import FastAPI, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from lib.common_objects import PlayerProfile, PlayerStatistics, GameResult, LeaderboardEntry, ProfileQuery
 from datetime import timedelta
 from borb.pdf import Document, Page, SingleColumnLayout, Paragraph, PDF, Image
+from PIL import Image as PILImage
+from avatars import AvatarCache
+from storage import Storage
+from players import PlayerTable, PROFILE_FIELDS
+from leaderboard import Leaderboard
 from decimal import Decimal
-from queue import Queue
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ProcessPoolExecutor
 
 app = FastAPI()
 
-players: dict[str, PlayerStatistics] = dict()
-pdfs: dict[str, asyncio.Future] = dict()
-queue = Queue()
+players = PlayerTable()
+leaderboard = Leaderboard()
+rendered: dict[str, tuple[int, bytes, str]] = dict()
+pdfs: dict[str, tuple[int, asyncio.Task]] = dict()
+renders: set[asyncio.Task] = set()
+RENDER_WORKERS = int(os.environ.get('RENDER_WORKERS', 0)) or os.cpu_count()
+RENDER_QUEUE_SIZE = int(os.environ.get('RENDER_QUEUE_SIZE', 64))
+AVATAR_CACHE_DIR = os.environ.get('AVATAR_CACHE_DIR', 'avatars')
+AVATAR_CACHE_BYTES = int(os.environ.get('AVATAR_CACHE_BYTES', 64 * 1024 * 1024))
+reported_games: dict[str, None] = dict()
+REPORTED_GAMES_LIMIT = 100000
+LEADERBOARD_PAGE_LIMIT = 100
+PROFILE_STREAM_CHUNK = 1000
+STORAGE_DIR = os.environ.get('STORAGE_DIR', 'data')
+SNAPSHOT_INTERVAL = float(os.environ.get('SNAPSHOT_INTERVAL', 300))
+
+
+def is_rendered(username: str) -> bool:
+    return username in rendered and rendered[username][0] == players.version(username)
+
+
+def is_rendering(username: str) -> bool:
+    return username in pdfs and pdfs[username][0] == players.version(username) and not pdfs[username][1].done()
+
+
+def add_result(username: str, won: bool, seconds: float) -> None:
+    players.add_result(username, won, round(seconds * 1e6))
+    leaderboard.update(username, *players.counters(username))
+
+
+def apply_event(event: list):
+    match event:
+        case ['register', profile]:
+            players.add(profile['username'], profile['picture'], profile['sex'], profile['email'])
+            leaderboard.update(profile['username'], *players.counters(profile['username']))
+        case ['modify', username, to_modify, value]:
+            players.set_profile_field(username, to_modify, value)
+        case ['result', username, won, seconds]:
+            add_result(username, won, seconds)
+        case ['game', game_id, results]:
+            unknown = []
+
+            if game_id in reported_games:
+                return unknown
+
+            reported_games[game_id] = None
+            if len(reported_games) > REPORTED_GAMES_LIMIT:
+                del reported_games[next(iter(reported_games))]
+
+            for username, won, seconds in results:
+                if username in players:
+                    add_result(username, won, seconds)
+                else:
+                    unknown.append(username)
+
+            return unknown
+        case ['remove', username]:
+            players.remove(username)
+            leaderboard.remove(username)
+
+            rendered.pop(username, None)
+            pdfs.pop(username, None)
+
+
+async def commit(event: list):
+    result = apply_event(event)
+
+    await storage.append(event)
+
+    return result
+
+
+def load_record(record: list) -> None:
+    match record:
+        case ['player', username, picture, sex, email, games_played, games_won, games_lost, seconds]:
+            players.add(username, picture, sex, email, games_played, games_won, games_lost, round(seconds * 1e6))
+        case ['game', game_id]:
+            reported_games[game_id] = None
+
+
+def dump_state():
+    game_ids = list(reported_games)
+
+    return chain(players.snapshot(), (['game', game_id] for game_id in game_ids))
 
 
 @app.put('/register')
 async def register(player: PlayerProfile) -> None:
-    players[player.username] = PlayerStatistics(profile=player, games_played=0, games_won=0, games_lost=0, time_played=timedelta())
+    await commit(['register', player.dict()])
+
+    avatars.prefetch(player.picture)
 
 
 @app.post('/modify/{username}')
 async def modify(username: str, to_modify: str, value: str) -> None:
-    if hasattr(players[username].profile, to_modify):
-        setattr(players[username].profile, to_modify, value)
+    if username not in players:
+        raise HTTPException(404)
+
+    if to_modify in PROFILE_FIELDS:
+        await commit(['modify', username, to_modify, value])
+
+        if to_modify == 'picture':
+            avatars.prefetch(value)
     else:
         raise HTTPException(405)
-    
+
 
 
 @app.get('/profile')
-async def profile(usernames: str) -> list[PlayerProfile]:
-    result = []
+async def profile(usernames: list[str] = Query(), fields: list[str] | None = Query(None)) -> StreamingResponse:
+    usernames = [username.strip() for value in usernames for username in value.split(',')]
 
-    for username in usernames.split(', '):
-        if username not in players:
-            raise HTTPException(404)
+    return stream_profiles(usernames, fields)
+
+
+@app.post('/profile')
+async def profiles(query: ProfileQuery) -> StreamingResponse:
+    return stream_profiles(query.usernames, query.fields)
+
+
+def stream_profiles(usernames: list[str], fields: list[str] | None) -> StreamingResponse:
+    fields = fields or list(PROFILE_FIELDS)
+    if any(field not in PROFILE_FIELDS for field in fields):
+        raise HTTPException(400, f'Profile fields are {", ".join(PROFILE_FIELDS)}')
+
+    return StreamingResponse(profile_lines(usernames, [PROFILE_FIELDS.index(field) for field in fields]), media_type='application/x-ndjson')
 
-        result.append(players[username].profile)
-    
-    return result
+
+async def profile_lines(usernames: list[str], fields: list[int]) -> AsyncIterator[str]:
+    for start in range(0, len(usernames), PROFILE_STREAM_CHUNK):
+        lines = []
+
+        for username in usernames[start:start + PROFILE_STREAM_CHUNK]:
+            if username in players:
+                lines.append(json.dumps({'username': username, 'found': True, 'profile': players.profile_fields(username, fields)}))
+            else:
+                lines.append(json.dumps({'username': username, 'found': False}))
+
+        yield '\n'.join(lines) + '\n'
 
 
 @app.delete('/remove/{username}')
 async def remove(username: str) -> None:
-    del players[username]
+    if username not in players:
+        raise HTTPException(404)
 
+    await commit(['remove', username])
 
-def generate_pdf(statistics: PlayerStatistics):
+
+def generate_pdf(statistics: PlayerStatistics, avatar: str | None) -> bytes:
     pdf = Document()
     page = Page()
     pdf.add_page(page)
     layout = SingleColumnLayout(page)
     layout.add(Paragraph(f'Username: {statistics.profile.username}'))
-    layout.add(Image(statistics.profile.picture, width=Decimal(256), height=Decimal(256)))
+    if avatar is not None:
+        layout.add(Image(PILImage.open(avatar), width=Decimal(256), height=Decimal(256)))
     layout.add(Paragraph(f'Sex: {statistics.profile.sex}'))
     layout.add(Paragraph(f'Email: {statistics.profile.email}'))
     layout.add(Paragraph(f'Games played: {str(statistics.games_played)}'))
@@ -62,30 +187,48 @@ def generate_pdf(statistics: PlayerStatistics):
     layout.add(Paragraph(f'Games lost: {str(statistics.games_lost)}'))
     layout.add(Paragraph(f'Time played: {str(statistics.time_played).split(".")[0]}'))
 
-    with open(f'{statistics.profile.username}.pdf', "wb") as pdf_file_handle:
-        PDF.dumps(pdf_file_handle, pdf)
+    pdf_bytes = BytesIO()
+    PDF.dumps(pdf_bytes, pdf)
+
+    return pdf_bytes.getvalue()
 
 
 @app.get('/statistics/{username}')
 async def statistics(username: str) -> str:
     if username not in players:
         raise HTTPException(404)
-    
-    pdfs[username] = asyncio.get_running_loop().create_future()
 
-    queue.put(username)
+    if not is_rendered(username) and not is_rendering(username):
+        if len(renders) >= RENDER_QUEUE_SIZE:
+            raise HTTPException(503, 'Too many statistics reports are being rendered, try again later', headers={'Retry-After': '1'})
+
+        version = players.version(username)
+        rendering = asyncio.create_task(render(username, version, players.statistics(username)))
+        renders.add(rendering)
+        rendering.add_done_callback(renders.discard)
+
+        pdfs[username] = (version, rendering)
 
     return f'http://127.0.0.1:13372/file/{username}.pdf'
 
 
 @app.get('/file/{username}.pdf')
-async def file(username: str) -> FileResponse:
+async def file(username: str, request: Request) -> Response:
     if username not in players:
         raise HTTPException(404)
-    
-    await pdfs[username]
 
-    return FileResponse(f'{username}.pdf')
+    if not is_rendered(username) and username in pdfs:
+        await asyncio.shield(pdfs[username][1])
+
+    if username not in rendered:
+        raise HTTPException(404)
+
+    _, pdf, etag = rendered[username]
+
+    if request.headers.get('if-none-match') == etag:
+        return Response(status_code=304, headers={'ETag': etag})
+
+    return Response(pdf, media_type='application/pdf', headers={'ETag': etag})
 
 
 @app.post('/result/{username}')
@@ -93,36 +236,80 @@ async def result(username: str, won: bool, time: timedelta) -> None:
     if username not in players:
         raise HTTPException(404)
 
-    players[username].games_played += 1
-    if won:
-        players[username].games_won += 1
-    else:
-        players[username].games_lost += 1
-    players[username].time_played += time
+    await commit(['result', username, won, time.total_seconds()])
+
 
+@app.post('/results')
+async def results(games: list[GameResult]) -> list[str]:
+    unknown = []
+    committed = []
 
-def process_tasks():
-    while True:
-        username = queue.get()
-        if username is None:
-            break
+    for game in games:
+        event = ['game', game.game_id, [[result.username, result.won, result.time.total_seconds()] for result in game.results]]
 
-        pdfs[username].set_result(generate_pdf(players[username]))
+        unknown.extend(apply_event(event))
+        committed.append(storage.append(event))
+
+    await asyncio.gather(*committed)
+
+    return unknown
+
+
+@app.get('/leaderboard')
+async def get_leaderboard(by: Literal['wins', 'win_rate', 'time_played'] = 'wins', count: int = 10, offset: int = 0) -> list[LeaderboardEntry]:
+    entries = leaderboard.top(by, max(0, min(count, LEADERBOARD_PAGE_LIMIT)), max(0, offset))
+
+    return [LeaderboardEntry(rank=rank, username=username, score=score) for rank, username, score in entries]
+
+
+@app.get('/leaderboard/{username}')
+async def get_leaderboard_rank(username: str, by: Literal['wins', 'win_rate', 'time_played'] = 'wins') -> LeaderboardEntry:
+    if username not in players:
+        raise HTTPException(404)
+
+    rank, score = leaderboard.rank(by, username)
+
+    return LeaderboardEntry(rank=rank, username=username, score=score)
+
+
+async def render(username: str, version: int, statistics: PlayerStatistics) -> None:
+    avatar = avatars.pin(statistics.profile.picture)
+
+    try:
+        pdf = await asyncio.get_running_loop().run_in_executor(executor, generate_pdf, statistics, avatar and avatars.path(avatar))
+    finally:
+        if avatar is not None:
+            avatars.unpin(avatar)
+
+    if username in players and (username not in rendered or rendered[username][0] < version):
+        rendered[username] = (version, pdf, f'"{md5(pdf).hexdigest()}"')
 
 
 @app.on_event('startup')
 async def startup():
-    global fut, executor
+    global executor, avatars, storage, snapshots, leaderboard
+
+    storage = Storage(STORAGE_DIR)
 
-    executor = ThreadPoolExecutor(1, "Tasks")
-    fut = asyncio.get_event_loop().run_in_executor(executor, process_tasks)
+    gc.disable()
+    try:
+        storage.recover(load_record, apply_event)
+        leaderboard = Leaderboard(players.all_counters())
+    finally:
+        gc.enable()
+    snapshots = asyncio.create_task(storage.run_snapshots(SNAPSHOT_INTERVAL, dump_state))
+
+    avatars = AvatarCache(AVATAR_CACHE_DIR, AVATAR_CACHE_BYTES)
+    executor = ProcessPoolExecutor(RENDER_WORKERS, mp_context=multiprocessing.get_context('spawn'))
 
 
 @app.on_event('shutdown')
 async def shutdown():
-    queue.put(None)
-    await fut
-    executor.shutdown()
+    snapshots.cancel()
+    await storage.close()
+
+    executor.shutdown(cancel_futures=True)
+    await avatars.close()
 
 
 def main():
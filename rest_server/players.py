@@ -0,0 +1,119 @@
+from array import array
+from datetime import timedelta
+from sys import intern
+from typing import Iterator
+
+from lib.common_objects import PlayerProfile, PlayerStatistics
+
+
+PROFILE_FIELDS = ('username', 'picture', 'sex', 'email')
+
+
+class PlayerTable:
+    def __init__(self):
+        self.ids: dict[str, int] = dict()
+        self.free: list[int] = []
+
+        self.profiles: list[tuple[str, str, str, str] | None] = []
+        self.games_played = array('q')
+        self.games_won = array('q')
+        self.games_lost = array('q')
+        self.time_played = array('q')
+        self.versions = array('q')
+
+    def __contains__(self, username: str) -> bool:
+        return username in self.ids
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def add(self, username: str, picture: str, sex: str, email: str, games_played: int = 0, games_won: int = 0, games_lost: int = 0, time_played: int = 0) -> int:
+        profile = (username, intern(picture), intern(sex), intern(email))
+
+        if username in self.ids:
+            id = self.ids[username]
+        elif self.free:
+            id = self.free.pop()
+        else:
+            id = len(self.profiles)
+            self.profiles.append(None)
+            for column in (self.games_played, self.games_won, self.games_lost, self.time_played, self.versions):
+                column.append(0)
+
+        self.ids[username] = id
+        self.profiles[id] = profile
+        self.games_played[id] = games_played
+        self.games_won[id] = games_won
+        self.games_lost[id] = games_lost
+        self.time_played[id] = time_played
+        self.versions[id] += 1
+
+        return id
+
+    def remove(self, username: str) -> None:
+        id = self.ids.pop(username)
+
+        self.profiles[id] = None
+        self.free.append(id)
+
+    def set_profile_field(self, username: str, field: str, value: str) -> None:
+        id = self.ids[username]
+
+        profile = list(self.profiles[id])
+        profile[PROFILE_FIELDS.index(field)] = intern(value)
+        self.profiles[id] = tuple(profile)
+
+        self.versions[id] += 1
+
+    def add_result(self, username: str, won: bool, microseconds: int) -> None:
+        id = self.ids[username]
+
+        self.games_played[id] += 1
+        if won:
+            self.games_won[id] += 1
+        else:
+            self.games_lost[id] += 1
+        self.time_played[id] += microseconds
+
+        self.versions[id] += 1
+
+    def counters(self, username: str) -> tuple[int, int, int]:
+        id = self.ids[username]
+
+        return self.games_played[id], self.games_won[id], self.time_played[id]
+
+    def all_counters(self) -> dict[str, tuple[int, int, int]]:
+        return {username: (self.games_played[id], self.games_won[id], self.time_played[id]) for username, id in self.ids.items()}
+
+    def version(self, username: str) -> int:
+        return self.versions[self.ids[username]]
+
+    def profile(self, username: str) -> PlayerProfile:
+        return PlayerProfile(**dict(zip(PROFILE_FIELDS, self.profiles[self.ids[username]])))
+
+    def profile_fields(self, username: str, fields: list[int]) -> dict[str, str]:
+        profile = self.profiles[self.ids[username]]
+
+        return {PROFILE_FIELDS[field]: profile[field] for field in fields}
+
+    def statistics(self, username: str) -> PlayerStatistics:
+        id = self.ids[username]
+
+        return PlayerStatistics(
+            profile=self.profile(username),
+            games_played=self.games_played[id],
+            games_won=self.games_won[id],
+            games_lost=self.games_lost[id],
+            time_played=timedelta(microseconds=self.time_played[id]),
+        )
+
+    def snapshot(self) -> Iterator[list]:
+        profiles = self.profiles.copy()
+        games_played, games_won, games_lost, time_played = (column[:] for column in (self.games_played, self.games_won, self.games_lost, self.time_played))
+
+        def records():
+            for id, profile in enumerate(profiles):
+                if profile is not None:
+                    yield ['player', *profile, games_played[id], games_won[id], games_lost[id], time_played[id] / 1e6]
+
+        return records()
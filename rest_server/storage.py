@@ -0,0 +1,165 @@
+import asyncio
+import json
+import logging
+import os
+from typing import Any, Callable, Iterable
+
+
+logger = logging.getLogger(__name__)
+
+ROTATE = object()
+
+
+class Storage:
+    def __init__(self, directory: str):
+        self.directory = directory
+
+        self.segment = 0
+        self.log_file = None
+
+        self.pending: list[Any] = []
+        self.waiters: list[asyncio.Future] = []
+        self.flusher: asyncio.Task | None = None
+        self.events_since_snapshot = 0
+
+        os.makedirs(directory, exist_ok=True)
+
+    def snapshot_path(self) -> str:
+        return os.path.join(self.directory, 'snapshot.json')
+
+    def log_path(self, segment: int) -> str:
+        return os.path.join(self.directory, f'log.{segment:08d}')
+
+    def segments(self) -> list[int]:
+        return sorted(int(name.split('.')[1]) for name in os.listdir(self.directory) if name.startswith('log.'))
+
+    def recover(self, load_record: Callable[[list], None], apply_event: Callable[[list], Any]) -> None:
+        first_segment = 0
+
+        if os.path.exists(self.snapshot_path()):
+            with open(self.snapshot_path()) as snapshot_file:
+                first_segment = json.loads(snapshot_file.readline())['segment']
+
+                for line in snapshot_file:
+                    load_record(json.loads(line))
+
+        segments = [segment for segment in self.segments() if segment >= first_segment]
+
+        for segment in segments:
+            with open(self.log_path(segment)) as log_file:
+                for line in log_file:
+                    try:
+                        event = json.loads(line)
+                    except ValueError:
+                        break
+
+                    apply_event(event)
+                    self.events_since_snapshot += 1
+
+        self.segment = max(segments, default=first_segment - 1) + 1
+        self.log_file = open(self.log_path(self.segment), 'a')
+
+    def append(self, event: list) -> asyncio.Future:
+        self.pending.append(json.dumps(event))
+        self.events_since_snapshot += 1
+
+        return self.wait_flush()
+
+    def wait_flush(self) -> asyncio.Future:
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters.append(waiter)
+
+        if self.flusher is None or self.flusher.done():
+            self.flusher = asyncio.create_task(self.flush())
+
+        return waiter
+
+    async def flush(self) -> None:
+        while self.pending:
+            lines, self.pending = self.pending, []
+            waiters, self.waiters = self.waiters, []
+
+            error = None
+            try:
+                await asyncio.get_running_loop().run_in_executor(None, self.write, lines)
+            except Exception as exception:
+                error = exception
+
+            for waiter in waiters:
+                if waiter.done():
+                    continue
+
+                if error is None:
+                    waiter.set_result(None)
+                else:
+                    waiter.set_exception(error)
+
+    def write(self, lines: list) -> None:
+        for line in lines:
+            if line is ROTATE:
+                self.sync()
+                self.log_file.close()
+
+                self.segment += 1
+                self.log_file = open(self.log_path(self.segment), 'a')
+            else:
+                self.log_file.write(line)
+                self.log_file.write('\n')
+
+        self.sync()
+
+    def sync(self) -> None:
+        self.log_file.flush()
+        os.fsync(self.log_file.fileno())
+
+    async def snapshot(self, dump_state: Callable[[], Iterable[list]]) -> None:
+        segment = self.segment + 1
+
+        self.pending.append(ROTATE)
+        rotated = self.wait_flush()
+
+        records = dump_state()
+        events, self.events_since_snapshot = self.events_since_snapshot, 0
+
+        try:
+            await rotated
+            await asyncio.get_running_loop().run_in_executor(None, self.write_snapshot, segment, records)
+        except Exception:
+            self.events_since_snapshot += events
+            raise
+
+    def write_snapshot(self, segment: int, records: Iterable[list]) -> None:
+        temporary_path = f'{self.snapshot_path()}.tmp'
+
+        with open(temporary_path, 'w') as snapshot_file:
+            snapshot_file.write(json.dumps({'segment': segment}))
+            snapshot_file.write('\n')
+
+            for record in records:
+                snapshot_file.write(json.dumps(record))
+                snapshot_file.write('\n')
+
+            snapshot_file.flush()
+            os.fsync(snapshot_file.fileno())
+
+        os.replace(temporary_path, self.snapshot_path())
+
+        for old_segment in self.segments():
+            if old_segment < segment:
+                os.remove(self.log_path(old_segment))
+
+    async def run_snapshots(self, interval: float, dump_state: Callable[[], Iterable[list]]) -> None:
+        while True:
+            await asyncio.sleep(interval)
+
+            if self.events_since_snapshot:
+                try:
+                    await self.snapshot(dump_state)
+                except Exception:
+                    logger.exception('Failed to write a snapshot to %s', self.directory)
+
+    async def close(self) -> None:
+        if self.flusher is not None:
+            await self.flusher
+
+        self.log_file.close()
@@ -0,0 +1,133 @@
+import asyncio
+import os
+import tempfile
+import unittest
+from io import BytesIO
+
+import httpx
+from PIL import Image
+
+from avatars import AvatarCache, normalize
+
+
+def picture(color: str) -> bytes:
+    data = BytesIO()
+    Image.new('RGB', (32, 32), color).save(data, format='PNG')
+
+    return data.getvalue()
+
+
+PICTURES = {f'/{color}.png': picture(color) for color in ['red', 'green', 'blue']}
+
+
+class AvatarCacheTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+        self.requests = []
+
+    def handle(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(request.url.path)
+
+        if request.url.path not in PICTURES:
+            return httpx.Response(404)
+
+        return httpx.Response(200, content=PICTURES[request.url.path])
+
+    def cache(self, max_bytes: int = 1 << 20) -> AvatarCache:
+        client = httpx.AsyncClient(transport=httpx.MockTransport(self.handle))
+
+        return AvatarCache(self.directory.name, max_bytes, client)
+
+    async def fetched(self, cache: AvatarCache) -> None:
+        await asyncio.gather(*cache.fetching.values())
+
+    def url(self, color: str) -> str:
+        return f'http://avatars/{color}.png'
+
+    async def test_miss_then_hit(self):
+        cache = self.cache()
+
+        self.assertIsNone(cache.pin(self.url('red')))
+        await self.fetched(cache)
+
+        content_hash = cache.pin(self.url('red'))
+        self.assertIsNotNone(content_hash)
+        with open(cache.path(content_hash), 'rb') as avatar_file:
+            self.assertEqual(avatar_file.read(), normalize(PICTURES['/red.png']))
+
+        cache.unpin(content_hash)
+        self.assertEqual(self.requests, ['/red.png'])
+
+        await cache.close()
+
+    async def test_prefetch_failure(self):
+        cache = self.cache()
+
+        cache.prefetch(self.url('missing'))
+        await self.fetched(cache)
+
+        self.assertIsNone(cache.pin(self.url('missing')))
+        self.assertEqual(cache.fetching, {})
+        self.assertEqual(self.requests, ['/missing.png'])
+
+        await cache.close()
+
+    async def test_eviction(self):
+        cache = self.cache(2 * max(len(normalize(data)) for data in PICTURES.values()))
+
+        async def fetch(color):
+            cache.prefetch(self.url(color))
+            await self.fetched(cache)
+
+        await fetch('red')
+        await fetch('green')
+
+        red = cache.pin(self.url('red'))
+        green_path = cache.path(cache.urls[self.url('green')])
+
+        await fetch('blue')
+        self.assertEqual(list(cache.urls), [self.url('red'), self.url('blue')])
+        self.assertFalse(os.path.exists(green_path))
+
+        await fetch('green')
+        self.assertEqual(list(cache.urls), [self.url('red'), self.url('green')])
+        self.assertTrue(os.path.exists(cache.path(red)))
+
+        cache.unpin(red)
+
+        await fetch('blue')
+        self.assertEqual(list(cache.urls), [self.url('green'), self.url('blue')])
+        self.assertFalse(os.path.exists(cache.path(red)))
+        self.assertLessEqual(cache.total_bytes, cache.max_bytes)
+
+        await cache.close()
+
+    async def test_reload_after_restart(self):
+        cache = self.cache()
+
+        for color in ['red', 'blue']:
+            cache.prefetch(self.url(color))
+        await self.fetched(cache)
+        await cache.close()
+
+        with open(os.path.join(self.directory.name, 'orphan.png'), 'wb') as orphan_file:
+            orphan_file.write(b'orphan')
+
+        cache = self.cache()
+
+        self.assertEqual(list(cache.urls), [self.url('red'), self.url('blue')])
+        self.assertFalse(os.path.exists(os.path.join(self.directory.name, 'orphan.png')))
+
+        content_hash = cache.pin(self.url('blue'))
+        self.assertTrue(os.path.exists(cache.path(content_hash)))
+        cache.unpin(content_hash)
+
+        self.assertEqual(sorted(self.requests), ['/blue.png', '/red.png'])
+
+        await cache.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
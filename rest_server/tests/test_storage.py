@@ -0,0 +1,90 @@
+import asyncio
+import os
+import tempfile
+import unittest
+
+from storage import Storage
+
+
+class StorageTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def recover(self):
+        records = []
+        events = []
+
+        storage = Storage(self.directory.name)
+        storage.recover(records.append, events.append)
+
+        return storage, records, events
+
+    async def test_append_snapshot_recover(self):
+        storage, records, events = self.recover()
+        self.assertEqual((records, events), ([], []))
+
+        await storage.append(['add', 'alice'])
+        await storage.append(['add', 'bob'])
+        await storage.snapshot(lambda: [['alice'], ['bob']])
+        await storage.append(['add', 'carol'])
+        await storage.close()
+
+        self.assertEqual([name for name in os.listdir(self.directory.name) if name.startswith('log.')], ['log.00000001'])
+
+        storage, records, events = self.recover()
+        self.assertEqual(records, [['alice'], ['bob']])
+        self.assertEqual(events, [['add', 'carol']])
+
+        await storage.append(['add', 'dave'])
+        await storage.close()
+
+        storage, records, events = self.recover()
+        self.assertEqual(records, [['alice'], ['bob']])
+        self.assertEqual(events, [['add', 'carol'], ['add', 'dave']])
+        await storage.close()
+
+    async def test_snapshot_failure(self):
+        storage, _, _ = self.recover()
+
+        attempts = []
+
+        def dump_state():
+            attempts.append(None)
+            if len(attempts) == 1:
+                raise OSError('disk full')
+
+            yield ['alice']
+
+        await storage.append(['add', 'alice'])
+
+        snapshots = asyncio.create_task(storage.run_snapshots(0.01, dump_state))
+        while not os.path.exists(storage.snapshot_path()) or storage.segments() != [storage.segment]:
+            await asyncio.sleep(0.01)
+
+        self.assertFalse(snapshots.done())
+        self.assertEqual(len(attempts), 2)
+        snapshots.cancel()
+        await storage.close()
+
+        storage, records, events = self.recover()
+        self.assertEqual((records, events), ([['alice']], []))
+        await storage.close()
+
+    async def test_cancelled_waiter(self):
+        storage, _, _ = self.recover()
+
+        first = storage.append(['add', 'alice'])
+        second = storage.append(['add', 'bob'])
+        first.cancel()
+
+        await asyncio.wait_for(second, 1)
+        await storage.close()
+
+        storage, _, events = self.recover()
+        self.assertEqual(events, [['add', 'alice'], ['add', 'bob']])
+        await storage.close()
+
+
+if __name__ == '__main__':
+    unittest.main()